@@ -0,0 +1,362 @@
+"""
+Trigram index of package file content.
+
+Licensed under MIT
+Copyright (c) 2012 Isaac Muse <isaacmuse@gmail.com>
+"""
+import hashlib
+import json
+import re
+import threading
+import zipfile
+import zlib
+from os import makedirs, remove, replace, stat
+from os.path import exists, join
+from .zip_reader import ZipReader
+from .content_search import read_archived, read_loose
+
+__all__ = (
+    "ContentIndex",
+    "query_trigrams"
+)
+
+CONTENT_INDEX_VERSION = 2
+MAX_INDEXED_SIZE = 512 * 1024
+REGEX_SPECIAL = set("\\.^$*+?[]()|")
+QUANTIFIERS = set("*+?")
+RE_VERBOSE_FLAG = re.compile(r"\(\?[a-zA-Z]*x")
+RE_ESCAPE = re.compile(
+    r"\\(?:x[0-9a-fA-F]{0,2}|u[0-9a-fA-F]{0,4}|U[0-9a-fA-F]{0,8}|N\{[^}]*\}?|[0-9]{1,3}|.)", re.DOTALL
+)
+RE_REPEAT = re.compile(r"\{(?:[0-9]+,?[0-9]*|,[0-9]*)\}")
+
+
+def get_trigrams(text):
+    """Get the set of lowercase trigrams in the text."""
+
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def skip_class(pattern, start):
+    """Get the index just past the character class starting at `start`."""
+
+    i = start + 1
+    if pattern[i:i + 1] == "^":
+        i += 1
+    if pattern[i:i + 1] == "]":
+        i += 1
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+        elif c == "]":
+            return i + 1
+        else:
+            i += 1
+    return len(pattern)
+
+
+def query_trigrams(pattern, regex=False):
+    """Get the trigrams every match of the pattern must contain (an empty set can't narrow the search)."""
+
+    if not regex:
+        return get_trigrams(pattern)
+
+    if "|" in pattern or RE_VERBOSE_FLAG.search(pattern):
+        return set()
+
+    runs = []
+    run = []
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            # Skip the whole escape, including hex, octal, and named character escapes.
+            runs.append(''.join(run))
+            run = []
+            i = RE_ESCAPE.match(pattern, i).end() if i + 1 < len(pattern) else len(pattern)
+            continue
+        if c == "[":
+            runs.append(''.join(run))
+            run = []
+            i = skip_class(pattern, i)
+            continue
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        repeat = RE_REPEAT.match(pattern, i) if c == "{" else None
+        if repeat is not None or c in REGEX_SPECIAL or depth:
+            if (repeat is not None or c in QUANTIFIERS) and run:
+                # The last character is optional or repeated.
+                run.pop()
+            runs.append(''.join(run))
+            run = []
+            if repeat is not None:
+                # Skip the repeat count.
+                i = repeat.end()
+                continue
+        else:
+            run.append(c)
+        i += 1
+    runs.append(''.join(run))
+
+    trigrams = set()
+    for r in runs:
+        trigrams |= get_trigrams(r)
+    return trigrams
+
+
+def get_stamp(pth):
+    """Get the `[mtime, size]` of a loose file."""
+
+    try:
+        st = stat(pth)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
+
+
+def get_resources_digest(record):
+    """Get a digest of the file resources a package record lists."""
+
+    return hashlib.sha1("\n".join(r for r in record.resources if not r.endswith('/')).encode('utf-8')).hexdigest()
+
+
+class PackagePostings(object):
+    """Trigram posting lists for one package location, with file stamps for unpacked packages."""
+
+    __slots__ = ("signature", "digest", "files", "unindexed", "postings", "stamps", "_known")
+
+    def __init__(self, signature, digest, files, unindexed, postings, stamps=None):
+        """Initialize."""
+
+        self.signature = signature
+        self.digest = digest
+        self.files = files
+        self.unindexed = unindexed
+        self.postings = postings
+        self.stamps = stamps
+        self._known = None
+
+    def is_current(self, record, signature):
+        """Check if the postings still describe the package and the resources its record lists."""
+
+        if self.signature != signature or self.digest != get_resources_digest(record):
+            return False
+        if self.stamps is not None:
+            for resource, stamp in zip(self.files, self.stamps):
+                if get_stamp(join(record.path, resource)) != stamp:
+                    return False
+        return True
+
+    def candidates(self, trigrams):
+        """Get the files that contain every trigram, plus files too large to index."""
+
+        ids = None
+        for trigram in trigrams:
+            posting = self.postings.get(trigram)
+            if not posting:
+                ids = set()
+                break
+            ids = set(posting) if ids is None else ids.intersection(posting)
+            if not ids:
+                break
+        if ids is None:
+            ids = set(range(len(self.files)))
+        ids.update(self.unindexed)
+        return {self.files[i] for i in ids}
+
+    def is_indexed(self, resource):
+        """Check if a file was indexed."""
+
+        if self._known is None:
+            self._known = set(self.files)
+        return resource in self._known
+
+
+class ContentIndex(object):
+    """Trigram posting index over the text files of every package, cached per package location."""
+
+    def __init__(self, cache_folder=None):
+        """Initialize."""
+
+        self.lock = threading.Lock()
+        self.cache_folder = cache_folder
+        self.packages = {}
+        self.building = False
+
+    def get_cache_file(self, pth):
+        """Get the cache file for a package location."""
+
+        return join(self.cache_folder, hashlib.sha1(pth.encode('utf-8')).hexdigest() + ".cache")
+
+    @staticmethod
+    def normalize_signature(signature):
+        """Normalize a signature so it compares equal after a JSON round trip."""
+
+        return json.loads(json.dumps(signature))
+
+    def load_package(self, record):
+        """Load a package's postings from the cache if they match the record."""
+
+        if self.cache_folder is None:
+            return None
+        cache_file = self.get_cache_file(record.path)
+        if not exists(cache_file):
+            return None
+        try:
+            with open(cache_file, 'rb') as f:
+                data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except Exception:
+            return None
+        if data.get("version") != CONTENT_INDEX_VERSION or data.get("path") != record.path:
+            return None
+        postings = PackagePostings(
+            data["signature"], data["digest"], data["files"], data["unindexed"], data["postings"], data["stamps"]
+        )
+        return postings if postings.is_current(record, self.normalize_signature(record.signature)) else None
+
+    def save_package(self, record, postings):
+        """Save a package's postings to the cache."""
+
+        if self.cache_folder is None:
+            return
+        data = {
+            "version": CONTENT_INDEX_VERSION,
+            "path": record.path,
+            "signature": postings.signature,
+            "digest": postings.digest,
+            "files": postings.files,
+            "unindexed": postings.unindexed,
+            "postings": postings.postings,
+            "stamps": postings.stamps
+        }
+        try:
+            if not exists(self.cache_folder):
+                makedirs(self.cache_folder)
+            cache_file = self.get_cache_file(record.path)
+            temp = cache_file + ".tmp"
+            with open(temp, 'wb') as f:
+                f.write(zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8')))
+            replace(temp, cache_file)
+        except Exception:
+            pass
+
+    def index_package(self, record):
+        """Read every text file of a package location and build its postings."""
+
+        files = []
+        unindexed = []
+        postings = {}
+        stamps = None if record.archived else []
+
+        def add(resource, data):
+            """Add a file's trigrams to the postings; binary files get none."""
+
+            file_id = len(files)
+            files.append(resource)
+            if data is None:
+                return
+            if len(data) > MAX_INDEXED_SIZE:
+                unindexed.append(file_id)
+                return
+            for trigram in get_trigrams(data.decode('utf-8', errors='replace')):
+                postings.setdefault(trigram, []).append(file_id)
+
+        resources = [r for r in record.resources if not r.endswith('/')]
+        try:
+            if record.archived:
+                with ZipReader(record.path) as z:
+                    for resource in resources:
+                        add(resource, read_archived(z, resource))
+            else:
+                for resource in resources:
+                    pth = join(record.path, resource)
+                    stamp = get_stamp(pth)
+                    try:
+                        data = read_loose(pth)
+                    except (IOError, OSError):
+                        continue
+                    stamps.append(stamp)
+                    add(resource, data)
+        except (zipfile.BadZipfile, IOError, OSError, KeyError, RuntimeError):
+            return None
+        return PackagePostings(
+            self.normalize_signature(record.signature), get_resources_digest(record), files, unindexed, postings, stamps
+        )
+
+    def update(self, records, cancelled=None):
+        """Bring the index up to date with the given package records, re-indexing only changed packages."""
+
+        with self.lock:
+            current = dict(self.packages)
+        fresh = {}
+        for record in records:
+            if cancelled is not None and cancelled():
+                return
+            signature = self.normalize_signature(record.signature)
+            postings = current.get(record.path)
+            if postings is None or not postings.is_current(record, signature):
+                postings = self.load_package(record)
+                if postings is None:
+                    postings = self.index_package(record)
+                    if postings is None:
+                        continue
+                    self.save_package(record, postings)
+            fresh[record.path] = postings
+
+        if self.cache_folder is not None:
+            for pth in set(current) - set(fresh):
+                try:
+                    remove(self.get_cache_file(pth))
+                except OSError:
+                    pass
+
+        with self.lock:
+            self.packages = fresh
+
+    def update_in_background(self, get_records):
+        """Update the index on its own thread with the records `get_records()` returns, unless an update is running."""
+
+        with self.lock:
+            if self.building:
+                return False
+            self.building = True
+
+        def run():
+            """Update the index."""
+
+            try:
+                self.update(get_records())
+            finally:
+                with self.lock:
+                    self.building = False
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def filter_targets(self, targets, trigrams):
+        """Narrow content search targets to files that can contain the trigrams; stale packages are left as is."""
+
+        if not trigrams:
+            return targets
+        with self.lock:
+            if self.building:
+                # Don't narrow with postings an update is about to replace.
+                return targets
+            packages = self.packages
+        filtered = []
+        for package, record, resources in targets:
+            postings = packages.get(record.path)
+            if postings is not None and postings.is_current(record, self.normalize_signature(record.signature)):
+                candidates = postings.candidates(trigrams)
+                resources = [r for r in resources if r in candidates or not postings.is_indexed(r)]
+                if not resources:
+                    continue
+            filtered.append((package, record, resources))
+        return filtered
@@ -0,0 +1,189 @@
+"""
+Search the content of package files.
+
+Licensed under MIT
+Copyright (c) 2012 Isaac Muse <isaacmuse@gmail.com>
+"""
+import re
+import threading
+import zipfile
+import zlib
+from os.path import join
+from concurrent.futures import ThreadPoolExecutor
+from .zip_reader import ZipReader
+
+__all__ = (
+    "ContentMatch",
+    "ContentSearch",
+    "get_search_targets",
+    "read_archived",
+    "read_loose"
+)
+
+BINARY_SNIFF_SIZE = 8192
+CHUNK_SIZE = 64 * 1024
+
+
+def is_binary(data):
+    """Check if the start of a file looks binary."""
+
+    return b'\0' in data[:BINARY_SNIFF_SIZE]
+
+
+def read_archived(z, resource):
+    """Read an archived member from an open `ZipReader`, returning `None` if it is binary."""
+
+    chunks = []
+    for chunk in z.iter_chunks(resource, CHUNK_SIZE):
+        if not chunks and is_binary(chunk):
+            return None
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def read_loose(pth):
+    """Read a loose file, returning `None` if it is binary."""
+
+    with open(pth, 'rb') as f:
+        head = f.read(BINARY_SNIFF_SIZE)
+        if is_binary(head):
+            return None
+        return head + f.read()
+
+
+class ContentMatch(object):
+    """A line in a package file that matched the content search."""
+
+    __slots__ = ("package", "record", "resource", "line", "text")
+
+    def __init__(self, package, record, resource, line, text):
+        """Initialize."""
+
+        self.package = package
+        self.record = record
+        self.resource = resource
+        self.line = line
+        self.text = text
+
+    @property
+    def location(self):
+        """Get the resource location with the line number."""
+
+        return "Packages/%s/%s:%d" % (self.package, self.resource, self.line)
+
+
+def get_search_targets(index, find_all=False):
+    """Get `(package_name, record, [resource, ...])` per package location; only active files unless `find_all`."""
+
+    targets = []
+    if find_all:
+        for record in index.get_records():
+            targets.append((record.name, record, [r for r in record.resources if not r.endswith('/')]))
+    else:
+        last = None
+        for name, record, res in index.iter_effective():
+            if last is None or last[1] is not record:
+                last = (name, record, [])
+                targets.append(last)
+            last[2].append(res)
+    return targets
+
+
+class ContentSearch(object):
+    """Search the content of package files on a pool of workers, stopping at `limit` matching lines."""
+
+    def __init__(self, pattern, regex=False, limit=1000, workers=4, cancelled=None):
+        """Initialize."""
+
+        self.pattern = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE | re.MULTILINE)
+        self.limit = limit
+        self.workers = max(1, workers)
+        self.cancelled = cancelled
+        self.lock = threading.Lock()
+        self.count = 0
+        self.files_searched = 0
+
+    def is_done(self):
+        """Check if the search should stop."""
+
+        return self.count >= self.limit or (self.cancelled is not None and self.cancelled())
+
+    def searched(self):
+        """Count a searched file."""
+
+        with self.lock:
+            self.files_searched += 1
+
+    def search_text(self, package, record, resource, data):
+        """Find the matching lines in the file's content."""
+
+        matches = []
+        text = data.decode('utf-8', errors='replace')
+        line = 1
+        last = 0
+        last_line_start = -1
+        for m in self.pattern.finditer(text):
+            start = m.start()
+            line += text.count('\n', last, start)
+            last = start
+            line_start = text.rfind('\n', 0, start) + 1
+            if line_start == last_line_start:
+                continue
+            last_line_start = line_start
+            line_end = text.find('\n', start)
+            content = text[line_start:line_end if line_end != -1 else len(text)].rstrip('\r')
+            matches.append(ContentMatch(package, record, resource, line, content.strip()))
+            with self.lock:
+                self.count += 1
+            if self.is_done():
+                break
+        return matches
+
+    def search_target(self, target):
+        """Search every file of one package location."""
+
+        package, record, resources = target
+        matches = []
+        if self.is_done():
+            return matches
+        try:
+            if record.archived:
+                with ZipReader(record.path) as z:
+                    for resource in resources:
+                        if self.is_done():
+                            break
+                        try:
+                            data = read_archived(z, resource)
+                        except (KeyError, RuntimeError, zipfile.BadZipfile, zlib.error):
+                            # A missing or unreadable member doesn't stop the rest of the archive.
+                            continue
+                        self.searched()
+                        if data is not None:
+                            matches.extend(self.search_text(package, record, resource, data))
+            else:
+                for resource in resources:
+                    if self.is_done():
+                        break
+                    try:
+                        data = read_loose(join(record.path, resource))
+                    except (IOError, OSError):
+                        continue
+                    self.searched()
+                    if data is not None:
+                        matches.extend(self.search_text(package, record, resource, data))
+        except (zipfile.BadZipfile, IOError, OSError):
+            pass
+        return matches
+
+    def run(self, targets):
+        """Search the targets and return the matches in target order."""
+
+        results = []
+        if self.workers == 1 or len(targets) <= 1:
+            for target in targets:
+                results.extend(self.search_target(target))
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(targets))) as executor:
+                for matches in executor.map(self.search_target, targets):
+                    results.extend(matches)
+        return results[:self.limit]
@@ -0,0 +1,100 @@
+"""
+Extract archived packages.
+
+Licensed under MIT
+Copyright (c) 2012 Isaac Muse <isaacmuse@gmail.com>
+"""
+import threading
+import zlib
+from os import makedirs, sep
+from os.path import dirname, isdir, join, normpath, getsize
+from concurrent.futures import ThreadPoolExecutor
+from .zip_reader import ZipReader
+
+__all__ = (
+    "extract_package",
+    "file_crc32"
+)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def file_crc32(pth):
+    """Get the CRC-32 of a file, reading it in chunks."""
+
+    crc = 0
+    with open(pth, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc & 0xFFFFFFFF
+
+
+def is_unchanged(pth, entry):
+    """Check if a file already holds a member, comparing the size first and then the CRC-32."""
+
+    try:
+        return getsize(pth) == entry.size and file_crc32(pth) == entry.crc
+    except OSError:
+        return False
+
+
+def ensure_folder(folder):
+    """Create a folder and its parents; another worker may create it first."""
+
+    try:
+        makedirs(folder)
+    except OSError:
+        if not isdir(folder):
+            raise
+
+
+def extract_package(archive, dest, workers=4, progress=None, cancelled=None):
+    """Extract an archive into `dest`, only writing members that differ, and return `(written, unchanged)` counts."""
+
+    dest = normpath(dest)
+    lock = threading.Lock()
+    counts = {"written": 0, "unchanged": 0, "done": 0}
+
+    with ZipReader(archive) as z:
+        entries = []
+        for entry in z.entries:
+            target = normpath(join(dest, entry.name))
+            if target.startswith(dest + sep):
+                entries.append((target, entry))
+
+        def extract(item):
+            """Extract one member unless it is unchanged."""
+
+            target, entry = item
+            if cancelled is not None and cancelled():
+                return
+            if entry.is_dir():
+                ensure_folder(target)
+                key = None
+            elif is_unchanged(target, entry):
+                key = "unchanged"
+            else:
+                ensure_folder(dirname(target))
+                data = z.read(entry)
+                with open(target, 'wb') as f:
+                    f.write(data)
+                key = "written"
+            with lock:
+                if key is not None:
+                    counts[key] += 1
+                counts["done"] += 1
+                done = counts["done"]
+            if progress is not None:
+                progress(done, len(entries))
+
+        ensure_folder(dest)
+        if workers <= 1 or len(entries) <= 1:
+            for item in entries:
+                extract(item)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Consume the results so errors raised by workers are not lost.
+                for _ in executor.map(extract, entries):
+                    pass
+
+    return counts["written"], counts["unchanged"]
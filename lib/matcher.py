@@ -0,0 +1,278 @@
+"""
+Precompiled file pattern matchers.
+
+Licensed under MIT
+Copyright (c) 2012 Isaac Muse <isaacmuse@gmail.com>
+"""
+import re
+import os
+import heapq
+from fnmatch import translate
+from functools import lru_cache
+
+__all__ = (
+    "compile_pattern",
+    "compile_excludes",
+    "DEFAULT_EXCLUDE_PATTERNS",
+    "is_regex_refinement",
+    "FuzzyMatcher"
+)
+
+GLOB_SPECIAL = re.compile(r"[*?\[]")
+RE_TRAILING_ESCAPE = re.compile(r"(?<!\\)(?:\\\\)*\\[a-zA-Z0-9]+$")
+RE_REPEAT = re.compile(r"\{(?:[0-9]+,?[0-9]*|,[0-9]*)\}")
+FUZZY_SEPARATORS = frozenset("/\\_-. ")
+DEFAULT_EXCLUDE_PATTERNS = (".git", ".svn", ".hg", ".DS_Store", "*.pyc", "*.pyo")
+
+
+class RegexMatcher(object):
+    """Match paths against a case insensitive regular expression anchored at the start."""
+
+    regex = True
+
+    def __init__(self, pattern):
+        """Compile the pattern."""
+
+        self.pattern = pattern
+        self.match = re.compile(pattern, re.IGNORECASE).match
+
+    def __call__(self, path):
+        """Check if the path matches."""
+
+        return self.match(path) is not None
+
+    def ifilter(self, paths):
+        """Lazily yield the paths that match."""
+
+        match = self.match
+        return (p for p in paths if match(p) is not None)
+
+    def filter(self, paths):
+        """Return the paths that match in one pass."""
+
+        return list(self.ifilter(paths))
+
+
+class GlobMatcher(object):
+    """Match paths against a wild card pattern the way `fnmatch.fnmatch` does, with string tests where possible."""
+
+    regex = False
+
+    def __init__(self, pattern):
+        """Compile the pattern."""
+
+        self.pattern = pattern
+        self.normcase = os.path.normcase if os.path.normcase("A/") != "A/" else None
+        pat = self.normcase(pattern) if self.normcase else pattern
+
+        self.literal = None
+        self.test = None
+        self.glob = None
+        if pat == "*":
+            self.test = self.match_all
+        else:
+            inner = pat
+            head = inner.startswith("*")
+            tail = inner.endswith("*")
+            inner = inner[1 if head else 0:-1 if tail else None]
+            if GLOB_SPECIAL.search(inner) is None:
+                self.literal = inner
+                if head and tail:
+                    self.test = self.match_contains
+                elif head:
+                    self.test = self.match_suffix
+                elif tail:
+                    self.test = self.match_prefix
+                else:
+                    self.test = self.match_literal
+        if self.test is None:
+            self.glob = re.compile(translate(pat)).match
+            self.test = self.match_glob
+
+        self.extension = None
+        self.name = None
+        literal = self.literal
+        if literal and "/" not in literal and "\\" not in literal:
+            if self.test == self.match_suffix and literal.startswith(".") and "." not in literal[1:]:
+                self.extension = literal.lower()
+            elif self.test == self.match_literal:
+                self.name = literal.lower()
+
+    def match_glob(self, path):
+        """Match paths with the translated wild card pattern."""
+
+        return self.glob(path) is not None
+
+    def match_all(self, path):
+        """Match everything."""
+
+        return True
+
+    def match_contains(self, path):
+        """Match paths containing the literal."""
+
+        return self.literal in path
+
+    def match_suffix(self, path):
+        """Match paths ending with the literal."""
+
+        return path.endswith(self.literal)
+
+    def match_prefix(self, path):
+        """Match paths starting with the literal."""
+
+        return path.startswith(self.literal)
+
+    def match_literal(self, path):
+        """Match paths equal to the literal."""
+
+        return path == self.literal
+
+    def __call__(self, path):
+        """Check if the path matches."""
+
+        return self.test(self.normcase(path) if self.normcase is not None else path)
+
+    def ifilter(self, paths):
+        """Lazily yield the paths that match."""
+
+        test = self.test
+        normcase = self.normcase
+        literal = self.literal
+        if normcase is not None:
+            return (p for p in paths if test(normcase(p)))
+        if test == self.match_all:
+            return iter(paths)
+        if test == self.match_suffix:
+            return (p for p in paths if p.endswith(literal))
+        if test == self.match_contains:
+            return (p for p in paths if literal in p)
+        if test == self.match_glob:
+            glob = self.glob
+            return (p for p in paths if glob(p) is not None)
+        return (p for p in paths if test(p))
+
+    def filter(self, paths):
+        """Return the paths that match in one pass."""
+
+        return list(self.ifilter(paths))
+
+
+class FuzzyMatcher(object):
+    """Rank lowercase paths by how well a query matches them as a subsequence."""
+
+    def __init__(self, query):
+        """Prepare the query."""
+
+        self.query = ''.join(query.lower().split())
+
+    def score_from(self, path, start, base):
+        """Score the greedy match of the query starting at `start`, or `None` if it doesn't match."""
+
+        score = 0
+        prev = -1
+        pos = start
+        for c in self.query:
+            idx = path.find(c, pos)
+            if idx == -1:
+                return None
+            bonus = 1
+            if idx == prev + 1:
+                bonus += 5
+            elif prev != -1:
+                bonus -= min(idx - prev - 1, 3)
+            if idx == 0 or path[idx - 1] in FUZZY_SEPARATORS:
+                bonus += 8
+            if idx >= base:
+                bonus += 2
+            score += bonus
+            prev = idx
+            pos = idx + 1
+        return score
+
+    def score(self, path):
+        """Score a lowercase path, or return `None` if the query doesn't match it."""
+
+        base = path.rfind('/') + 1
+        best = self.score_from(path, 0, base)
+        if best is not None and base:
+            in_name = self.score_from(path, base, base)
+            if in_name is not None and in_name > best:
+                best = in_name
+        return best
+
+    def rank(self, paths, limit):
+        """Get the indexes of the best `limit` matches in `paths`, best first; ties go to shorter, earlier paths."""
+
+        if not self.query:
+            return list(range(min(limit, len(paths))))
+        score = self.score
+        scored = ((score(p), -len(p), -i) for i, p in enumerate(paths))
+        return [-entry[2] for entry in heapq.nlargest(limit, (entry for entry in scored if entry[0] is not None))]
+
+
+class ExcludeMatcher(object):
+    """Match file and folder names, or any part of a `/` separated path, against the exclusion patterns."""
+
+    def __init__(self, patterns):
+        """Compile the patterns."""
+
+        self.patterns = tuple(patterns)
+        flags = re.IGNORECASE if os.path.normcase("A") != "A" else 0
+        parts = '|'.join(self.translate(p) for p in self.patterns) or '(?!)'
+        self.name_match = re.compile(r"(?:%s)\Z" % parts, flags).match
+        self.path_search = re.compile(r"(?:^|/)(?:%s)(?=/|\Z)" % parts, flags).search
+
+    @staticmethod
+    def translate(pattern):
+        """Translate a name pattern into a regular expression that stays within one name."""
+
+        return ''.join(
+            '[^/]*' if c == '*' else '[^/]' if c == '?' else re.escape(c) for c in pattern
+        )
+
+    def excludes_name(self, name):
+        """Check if a file or folder name is excluded."""
+
+        return self.name_match(name) is not None
+
+    def excludes_path(self, path):
+        """Check if any part of a `/` separated path is excluded."""
+
+        return self.path_search(path) is not None
+
+    def prune(self, names):
+        """Remove excluded names from a list in place, so `os.walk` won't descend into them."""
+
+        names[:] = [n for n in names if self.name_match(n) is None]
+
+
+@lru_cache(maxsize=8)
+def compile_excludes(patterns=DEFAULT_EXCLUDE_PATTERNS):
+    """Compile exclusion patterns once; `patterns` must be hashable, like a tuple."""
+
+    return ExcludeMatcher(patterns)
+
+
+@lru_cache(maxsize=64)
+def compile_pattern(pattern, regex=False):
+    """Compile and memoize a `RegexMatcher` or `GlobMatcher` for the search pattern."""
+
+    return RegexMatcher(pattern) if regex else GlobMatcher(pattern)
+
+
+def is_regex_refinement(previous, pattern):
+    """Check if `pattern` only appends to `previous` in a way that can't widen what `previous` matched."""
+
+    if not pattern.startswith(previous):
+        return False
+    suffix = pattern[len(previous):]
+    if suffix[:1] in ("*", "+", "?", "{"):
+        return False
+    if "|" in pattern or "(?" in pattern:
+        return False
+    # Every brace in `previous` must belong to a complete repeat count, so appended text can't close one.
+    leftover = RE_REPEAT.sub("", previous)
+    if "\\{" in previous or "\\}" in previous or "{" in leftover or "}" in leftover:
+        return False
+    return RE_TRAILING_ESCAPE.search(previous) is None
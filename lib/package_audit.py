@@ -0,0 +1,181 @@
+"""
+Audit package files against archive metadata.
+
+Licensed under MIT
+Copyright (c) 2012 Isaac Muse <isaacmuse@gmail.com>
+"""
+import zipfile
+from os.path import getsize, join
+from concurrent.futures import ThreadPoolExecutor
+from .zip_reader import ZipReader
+from .extract import file_crc32
+
+__all__ = (
+    "PackageDrift",
+    "find_drift",
+    "DuplicateGroup",
+    "find_duplicates"
+)
+
+
+class PackageDrift(object):
+    """How an unpacked override package differs from the archive it overrides."""
+
+    __slots__ = ("name", "folder", "archive", "modified", "added", "unchanged")
+
+    def __init__(self, name, folder, archive):
+        """Initialize."""
+
+        self.name = name
+        self.folder = folder
+        self.archive = archive
+        self.modified = []
+        self.added = []
+        self.unchanged = 0
+
+
+def check_drift(name, folder, resources, archive):
+    """Compare an unpacked package's files with the archive it overrides by size and CRC-32."""
+
+    drift = PackageDrift(name, folder, archive)
+    with ZipReader(archive) as z:
+        for res in resources:
+            if res.endswith('/'):
+                continue
+            entry = z.get(res)
+            if entry is None:
+                drift.added.append(res)
+                continue
+            pth = join(folder, res)
+            try:
+                same = getsize(pth) == entry.size and file_crc32(pth) == entry.crc
+            except OSError:
+                continue
+            if same:
+                drift.unchanged += 1
+            else:
+                drift.modified.append(res)
+    return drift
+
+
+def find_drift(overrides, workers=4, cancelled=None):
+    """Get a `PackageDrift` for each `(name, folder, resources, archive)` override, several at a time."""
+
+    def check(override):
+        """Check one package."""
+
+        if cancelled is not None and cancelled():
+            return None
+        try:
+            return check_drift(*override)
+        except (zipfile.BadZipfile, IOError, OSError):
+            return None
+
+    if workers <= 1 or len(overrides) <= 1:
+        results = [check(o) for o in overrides]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(overrides))) as executor:
+            results = list(executor.map(check, overrides))
+    return [r for r in results if r is not None]
+
+
+class DuplicateGroup(object):
+    """Identical files found in more than one package, as `(package, location, resource)` members."""
+
+    __slots__ = ("size", "crc", "members", "packages")
+
+    def __init__(self, size, crc, members, packages):
+        """Initialize."""
+
+        self.size = size
+        self.crc = crc
+        self.members = members
+        self.packages = packages
+
+    @property
+    def wasted(self):
+        """Get the bytes taken by the extra copies, counting one copy per package."""
+
+        return self.size * (self.packages - 1)
+
+
+def list_files(location):
+    """List `(size, crc, member)` for the files of a package location; loose files get a `None` CRC-32."""
+
+    name, path, archived, resources = location
+    files = []
+    if archived:
+        wanted = set(resources)
+        with ZipReader(path) as z:
+            for entry in z.entries:
+                if not entry.is_dir() and entry.name in wanted:
+                    files.append((entry.size, entry.crc, (name, path, entry.name)))
+    else:
+        for res in resources:
+            if not res.endswith('/'):
+                try:
+                    files.append((getsize(join(path, res)), None, (name, path, res)))
+                except OSError:
+                    pass
+    return files
+
+
+def loose_crc(member):
+    """Get the CRC-32 of a loose file, or `None` if it can't be read."""
+
+    try:
+        return file_crc32(join(member[1], member[2]))
+    except (IOError, OSError):
+        return None
+
+
+def find_duplicates(locations, workers=4, cancelled=None, fold=None):
+    """Group identical files across packages and return `(groups, files, hashed)`, or `None` if cancelled."""
+
+    def scan(location):
+        """List one location's files."""
+
+        if cancelled is not None and cancelled():
+            return []
+        try:
+            return list_files(location)
+        except (zipfile.BadZipfile, IOError, OSError):
+            return []
+
+    workers = max(1, min(workers, len(locations) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        listed = list(executor.map(scan, locations))
+        if cancelled is not None and cancelled():
+            return None
+
+        by_size = {}
+        files = 0
+        for listing in listed:
+            for size, crc, member in listing:
+                files += 1
+                if size:
+                    by_size.setdefault(size, []).append((crc, member))
+
+        # Only loose files that collide on size are read.
+        collisions = [(size, bucket) for size, bucket in by_size.items() if len(bucket) > 1]
+        loose = [member for _, bucket in collisions for crc, member in bucket if crc is None]
+        crcs = dict(zip(loose, executor.map(loose_crc, loose)))
+        if cancelled is not None and cancelled():
+            return None
+
+    groups = []
+    for size, bucket in collisions:
+        by_crc = {}
+        for crc, member in bucket:
+            if crc is None:
+                crc = crcs[member]
+                if crc is None:
+                    continue
+            by_crc.setdefault(crc, []).append(member)
+        for crc, members in by_crc.items():
+            # `fold` compares package names the way the platform does.
+            packages = len(set(m[0] if fold is None else fold(m[0]) for m in members))
+            if packages > 1:
+                groups.append(DuplicateGroup(size, crc, sorted(members), packages))
+    groups.sort(key=lambda g: (-g.wasted, g.members))
+    return groups, files, len(loose)
@@ -6,8 +6,24 @@ Copyright (c) 2012 Isaac Muse <isaacmuse@gmail.com>
 """
 import sublime
 import re
-from os import walk, listdir
+import threading
+from sys import intern
+from collections import OrderedDict
+from itertools import chain
+import time
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from .zip_reader import ZipReader
+from .matcher import compile_pattern, compile_excludes, is_regex_refinement, FuzzyMatcher, DEFAULT_EXCLUDE_PATTERNS
+from os import walk, listdir, stat, makedirs, replace
+try:
+    from os import scandir
+except ImportError:
+    # Python 3.3 (Sublime Text 3) has no `scandir`.
+    scandir = None
 from os.path import basename, dirname, isdir, join, normpath, splitext, exists
+from stat import S_ISDIR, S_ISREG
 from fnmatch import fnmatch
 import zipfile
 
@@ -17,11 +33,26 @@ __all__ = (
     "packagename",
     "get_packages",
     "get_packages_location",
+    "get_catalog",
     "get_package_contents",
+    "get_package_tree",
+    "get_index",
+    "load_index",
+    "benchmark_index",
+    "query_cache",
     "PackageSearch"
 )
 
-EXCLUDE_PATTERN = re.compile(r"(?:/|^)(?:[^/]*\.(?:pyc|pyo)|\.git|\.svn|\.hg|\.DS_Store)(?=$|/)")
+ORIGIN_PACKAGES = "Packages"
+ORIGIN_INSTALLED = "Installed"
+ORIGIN_DEFAULT = "Default"
+ORIGINS_BY_LOCATION = (ORIGIN_DEFAULT, ORIGIN_INSTALLED, ORIGIN_PACKAGES)
+
+INDEX_CACHE_VERSION = 2
+DEFAULT_INDEX_WORKERS = 4
+DEFAULT_FUZZY_RESULTS = 200
+DEFAULT_QUERY_CACHE_SIZE = 32
+DEFAULT_MAX_RESULTS = 10000
 
 
 def sublime_package_paths():
@@ -34,15 +65,74 @@ def sublime_package_paths():
     ]
 
 
+class CatalogEntry(object):
+    """A package found in one of the package locations, with the stat signature taken when it was found."""
+
+    __slots__ = ("name", "origin", "path", "signature")
+
+    def __init__(self, name, origin, path, signature):
+        """Initialize."""
+
+        self.name = name
+        self.origin = origin
+        self.path = path
+        self.signature = signature
+
+    @property
+    def archived(self):
+        """Check if the package is a `sublime-package` archive."""
+
+        return self.origin != ORIGIN_PACKAGES
+
+
+def scan_location(origin, folder):
+    """List the packages in one package location with their `(mtime, size)` signatures."""
+
+    archives = origin != ORIGIN_PACKAGES
+    entries = []
+    try:
+        if scandir is not None:
+            for item in scandir(folder):
+                if archives:
+                    if not fnmatch(item.name, "*.sublime-package") or not item.is_file():
+                        continue
+                elif not item.is_dir():
+                    continue
+                st = item.stat()
+                name = splitext(item.name)[0] if archives else item.name
+                entries.append(CatalogEntry(name, origin, item.path, (st.st_mtime, st.st_size)))
+        else:
+            for item in listdir(folder):
+                if archives and not fnmatch(item, "*.sublime-package"):
+                    continue
+                pth = join(folder, item)
+                st = stat(pth)
+                if (S_ISREG if archives else S_ISDIR)(st.st_mode):
+                    name = splitext(item)[0] if archives else item
+                    entries.append(CatalogEntry(name, origin, pth, (st.st_mtime, st.st_size)))
+    except OSError:
+        pass
+    return entries
+
+
+def scan_catalog():
+    """Scan every package location and return a `CatalogEntry` for each package."""
+
+    installed_pth, default_pth, user_pth = sublime_package_paths()
+    catalog = []
+    for origin, pth in (
+        (ORIGIN_PACKAGES, user_pth),
+        (ORIGIN_INSTALLED, installed_pth),
+        (ORIGIN_DEFAULT, default_pth)
+    ):
+        catalog.extend(scan_location(origin, pth))
+    return catalog
+
+
 def scan_for_packages(file_path, archives=False):
     """Look for zipped and unzipped plugins."""
 
-    if archives:
-        plugins = [join(file_path, item) for item in listdir(file_path) if fnmatch(item, "*.sublime-package")]
-    else:
-        plugins = [join(file_path, item) for item in listdir(file_path) if isdir(join(file_path, item))]
-
-    return plugins
+    return [e.path for e in scan_location(ORIGIN_INSTALLED if archives else ORIGIN_PACKAGES, file_path)]
 
 
 def packagename(pth, normalize=False):
@@ -52,110 +142,677 @@ def packagename(pth, normalize=False):
         name = basename(pth)
     else:
         name = splitext(basename(pth))[0]
-    return name.lower() if sublime.platform() == "windows" and normalize else name
+    return fold_case(name) if normalize else name
 
 
 def get_packages_location():
-    """Get all packages.  Optionally disable resolving override packages."""
+    """Get the paths of the default archives, installed archives, and unpacked packages."""
 
-    installed_pth, default_pth, user_pth = sublime_package_paths()
+    catalog = get_catalog()
+    return tuple([e.path for e in catalog if e.origin == origin] for origin in ORIGINS_BY_LOCATION)
 
-    installed_pkgs = scan_for_packages(installed_pth, archives=True)
-    default_pkgs = scan_for_packages(default_pth, archives=True)
-    user_pkgs = scan_for_packages(user_pth)
 
-    return default_pkgs, installed_pkgs, user_pkgs
+def get_mtime(pth):
+    """Get the modified time of a path or `None` if it doesn't exist."""
 
+    try:
+        return stat(pth).st_mtime
+    except OSError:
+        return None
 
-def get_folder_resources(folder_pkg, pkg_name, content_folders, content_files):
-    """Get resources in folder."""
 
+def get_stat_signature(pth):
+    """Get the stat signature (mtime and size) of a path or `None` if it doesn't exist."""
+
+    try:
+        st = stat(pth)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def get_folder_resources(folder_pkg, dir_mtimes=None, excludes=None):
+    """Get resources in folder, skipping excluded files and folders."""
+
+    resources = []
     if exists(folder_pkg):
         for base, dirs, files in walk(folder_pkg):
-            file_objs = []
-            for d in dirs[:]:
-                if EXCLUDE_PATTERN.search(d) is not None:
-                    dirs.remove(d)
+            if excludes is not None:
+                excludes.prune(dirs)
+                excludes.prune(files)
+            if dir_mtimes is not None:
+                dir_mtimes.append((base, get_mtime(base)))
+            rel = base[len(folder_pkg):].replace("\\", "/").strip("/")
+            prefix = rel + "/" if rel else ""
             for f in files:
-                if EXCLUDE_PATTERN.search(f) is None:
-                    file_name = join(base, f).replace(folder_pkg, "Packages/%s" % pkg_name, 1).replace("\\", "/")
-                    file_objs.append(file_name)
-                    content_files.append(file_name)
-            if len(file_objs) == 0 and len(dirs) == 0:
-                content_folders.append(base.replace(folder_pkg, "Packages/%s" % pkg_name, 1).replace("\\", "/") + "/")
-
-
-def in_list(x, l):
-    """Find if x (string) is in l (list)."""
-
-    found = False
-    if sublime.platform() == "windows":
-        for item in l:
-            if item.lower() == x.lower():
-                found = True
-                break
-    else:
-        found = x in l
-    return found
+                resources.append(prefix + f)
+            if len(files) == 0 and len(dirs) == 0 and rel:
+                resources.append(prefix)
+    return resources
 
 
-def get_zip_resources(zip_pkg, pkg_name, content_folders, content_files):
-    """Get resources in archive that are not already in the lists."""
+def get_zip_resources(zip_pkg, excludes=None):
+    """Get resources in archive, skipping those in or under an excluded name."""
 
+    resources = []
     if exists(zip_pkg):
-        with zipfile.ZipFile(zip_pkg, 'r') as z:
-            for item in z.infolist():
-                file_name = item.filename
-                if EXCLUDE_PATTERN.search(file_name) is None:
-                    package_name = "Packages/%s/%s" % (pkg_name, file_name)
-                    if package_name.endswith('/'):
-                        if not in_list(package_name, content_folders):
-                            content_folders.append(package_name)
-                    elif not package_name.endswith('/'):
-                        if not in_list(package_name, content_files):
-                            content_files.append(package_name)
+        with ZipReader(zip_pkg) as z:
+            names = z.names()
+        if excludes is not None:
+            names = [n for n in names if not excludes.excludes_path(n)]
+        resources = sorted(names)
+    return resources
+
+
+def fold_case(name):
+    """Normalize the case of a name the way the platform compares paths."""
+
+    return name.lower() if sublime.platform() == "windows" else name
+
+
+class ResourceSet(object):
+    """Set of names that compares them the way the platform compares paths."""
+
+    __slots__ = ("keys", "fold")
+
+    def __init__(self):
+        """Initialize."""
+
+        self.keys = set()
+        self.fold = sublime.platform() == "windows"
+
+    def __contains__(self, name):
+        """Check if the name is in the set."""
+
+        return (name.lower() if self.fold else name) in self.keys
+
+    def __len__(self):
+        """Get the number of names in the set."""
+
+        return len(self.keys)
+
+    def add(self, name):
+        """Add the name to the set and return `True` if it was not already present."""
+
+        key = name.lower() if self.fold else name
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+
+class PackageRecord(object):
+    """A package location and the resources it holds."""
+
+    __slots__ = ("name", "origin", "path", "signature", "resources", "_extensions", "_names")
+
+    def __init__(self, name, origin, path, signature, resources):
+        """Initialize."""
+
+        self.name = intern(name)
+        self.origin = origin
+        self.path = path
+        self.signature = signature
+        # Overrides and default/installed copies repeat the same paths.
+        self.resources = [intern(r) for r in resources]
+        self._extensions = None
+        self._names = None
+
+    def build_lookups(self):
+        """Build the extension and file name lookups."""
+
+        extensions = {}
+        names = {}
+        for res in self.resources:
+            name = res.rstrip('/')
+            name = name[name.rfind('/') + 1:].lower()
+            dot = name.rfind('.')
+            if dot != -1:
+                extensions.setdefault(name[dot:], []).append(res)
+            names.setdefault(name, []).append(res)
+        self._names = names
+        self._extensions = extensions
+
+    def find_extension(self, extension):
+        """Get the resources with the given lowercase extension (including the dot)."""
+
+        if self._extensions is None:
+            self.build_lookups()
+        return self._extensions.get(extension, [])
+
+    def find_name(self, name):
+        """Get the resources with the given lowercase file name."""
+
+        if self._names is None:
+            self.build_lookups()
+        return self._names.get(name, [])
+
+    def select(self, matcher):
+        """Get the resources that could match the matcher."""
+
+        extension = getattr(matcher, "extension", None)
+        if extension is not None:
+            return self.find_extension(extension)
+        name = getattr(matcher, "name", None)
+        if name is not None:
+            return self.find_name(name)
+        return self.resources
+
+    @property
+    def archived(self):
+        """Check if the package is a `sublime-package` archive."""
+
+        return self.origin != ORIGIN_PACKAGES
+
+
+class ResourceIndex(object):
+    """Process wide index of every package's resources, re-reading only packages whose stat signature changed."""
+
+    def __init__(self, cache_file=None):
+        """Initialize."""
+
+        self.lock = threading.RLock()
+        self.exclude_patterns = None
+        self.ignored = frozenset()
+        self.records = []
+        self.generation = 0
+        self.cache_file = cache_file
+        self._derived = {}
+
+    @staticmethod
+    def is_stale(record, entry=None):
+        """Check if the package has changed since the record was made."""
+
+        if record.archived:
+            signature = entry.signature if entry is not None else get_stat_signature(record.path)
+            return signature != record.signature
+        for pth, mtime in record.signature:
+            current = entry.signature[0] if entry is not None and pth == entry.path else get_mtime(pth)
+            if current != mtime:
+                return True
+        return False
+
+    @staticmethod
+    def read_package(entry, excludes=None):
+        """Read the resources of a cataloged package, leaving out excluded ones, and create its record."""
+
+        if not entry.archived:
+            signature = []
+            resources = get_folder_resources(entry.path, signature, excludes)
+            signature = tuple(signature)
+        else:
+            signature = entry.signature
+            try:
+                resources = get_zip_resources(entry.path, excludes)
+            except (zipfile.BadZipfile, OSError):
+                resources = []
+        return PackageRecord(entry.name, entry.origin, entry.path, signature, resources)
+
+    @classmethod
+    def read_packages(cls, packages, workers=1, excludes=None):
+        """Read the given cataloged packages, in order, on a bounded thread pool."""
+
+        if workers <= 1 or len(packages) <= 1:
+            return [cls.read_package(entry, excludes) for entry in packages]
+        with ThreadPoolExecutor(max_workers=min(workers, len(packages))) as executor:
+            return list(executor.map(lambda entry: cls.read_package(entry, excludes), packages))
+
+    def refresh(self):
+        """Read any package that was added or changed and drop packages that were removed."""
+
+        excludes = get_excludes()
+        ignored = get_ignored_packages()
+        with self.lock:
+            current = {(r.origin, r.path): r for r in self.records}
+            if excludes.patterns != self.exclude_patterns:
+                # Records made with other exclusions must all be read again.
+                current = {}
+                self.exclude_patterns = excludes.patterns
+            records = []
+            stale = []
+            for entry in scan_catalog():
+                record = current.get((entry.origin, entry.path))
+                if record is None or self.is_stale(record, entry):
+                    stale.append((len(records), entry))
+                records.append(record)
+            changed = len(stale) > 0
+            if changed:
+                fresh = self.read_packages([entry for _, entry in stale], get_index_workers(), excludes)
+                for (i, _), record in zip(stale, fresh):
+                    records[i] = record
+            if changed or len(records) != len(self.records):
+                self.records = records
+                self.generation += 1
+                self.save()
+            if ignored != self.ignored:
+                self.ignored = ignored
+                self.generation += 1
+        return self
+
+    def load(self):
+        """Load the records from the snapshot."""
+
+        if self.cache_file is None or not exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'rb') as f:
+                data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except Exception:
+            return
+        if data.get("version") != INDEX_CACHE_VERSION:
+            return
+
+        records = []
+        for name, origin, pth, signature, resources in data["packages"]:
+            if origin == ORIGIN_PACKAGES:
+                signature = tuple(tuple(s) for s in signature)
+            elif signature is not None:
+                signature = tuple(signature)
+            records.append(PackageRecord(name, origin, pth, signature, resources))
+
+        with self.lock:
+            if not self.records:
+                self.records = records
+                excludes = data.get("excludes")
+                self.exclude_patterns = tuple(excludes) if excludes is not None else None
+                self.generation += 1
+
+    def save(self):
+        """Save the records to the snapshot."""
+
+        if self.cache_file is None:
+            return
+        with self.lock:
+            data = {
+                "version": INDEX_CACHE_VERSION,
+                "excludes": self.exclude_patterns,
+                "packages": [[r.name, r.origin, r.path, r.signature, r.resources] for r in self.records]
+            }
+        try:
+            folder = dirname(self.cache_file)
+            if not exists(folder):
+                makedirs(folder)
+            temp = self.cache_file + ".tmp"
+            with open(temp, 'wb') as f:
+                f.write(zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8')))
+            replace(temp, self.cache_file)
+        except Exception:
+            pass
+
+    def get_records(self, origin=None):
+        """Get the package records, optionally only those of the given origin."""
+
+        with self.lock:
+            records = self.records
+        return [r for r in records if origin is None or r.origin == origin]
+
+    def get_package(self, name):
+        """Get the records for the given package name in override order (unpacked, installed, default)."""
+
+        name = fold_case(name)
+        return [r for r in self.get_records() if fold_case(r.name) == name]
+
+    def iter_effective(self, matcher=None):
+        """Iterate `(package_name, record, resource)` for the active files of packages that aren't ignored."""
+
+        packages = {}
+        for record in self.get_records():
+            key = fold_case(record.name)
+            if key not in self.ignored:
+                packages.setdefault(key, []).append(record)
+
+        for key in sorted(packages):
+            records = packages[key]
+            name = records[0].name
+            archives = [r for r in records if r.archived][:1]
+            seen = ResourceSet()
+            for record in [r for r in records if not r.archived] + archives:
+                for res in (record.resources if matcher is None else record.select(matcher)):
+                    if not res.endswith('/') and seen.add(res):
+                        yield name, record, res
+
+    def get_derived(self, key, build):
+        """Get a value derived from the records, building it once per index generation."""
+
+        with self.lock:
+            generation = self.generation
+            cached = self._derived.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        value = build()
+        with self.lock:
+            self._derived[key] = (generation, value)
+        return value
+
+    def get_effective_resources(self, matcher=None):
+        """Get the `Packages/<name>/<path>` resources that are active after overrides are resolved."""
+
+        if matcher is None:
+            return self.get_derived(
+                "effective",
+                lambda: ["Packages/%s/%s" % (name, res) for name, _, res in self.iter_effective()]
+            )
+        return ["Packages/%s/%s" % (name, res) for name, _, res in self.iter_effective(matcher)]
+
+    def get_lowercase_paths(self, effective=True):
+        """Get `(entries, paths)` for fuzzy matching, built once per index generation."""
+
+        def build():
+            """Build the entries and their lowercase paths."""
+
+            if effective:
+                entries = list(self.iter_effective())
+            else:
+                entries = [
+                    (r.name, r, res) for r in self.get_records() for res in r.resources if not res.endswith('/')
+                ]
+            return entries, [("%s/%s" % (name, res)).lower() for name, _, res in entries]
+
+        return self.get_derived(("lowercase", effective), build)
+
+
+class QueryCache(object):
+    """Least recently used cache of search results, keyed by query and index generation."""
+
+    def __init__(self, size=DEFAULT_QUERY_CACHE_SIZE):
+        """Initialize."""
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(pattern, regex, find_all, generation, limit=None):
+        """Get the cache key for a search."""
+
+        if find_all:
+            pattern = pattern.strip()
+        if not regex:
+            pattern = fold_case(pattern)
+        return (pattern, regex, find_all, generation, limit)
+
+    def get(self, key):
+        """Get cached results or `None`."""
+
+        with self.lock:
+            items = self.entries.get(key)
+            if items is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return items
+
+    def put(self, key, items):
+        """Cache results, dropping the least recently used results to stay in size."""
+
+        with self.lock:
+            self.entries[key] = items
+            self.entries.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        """Drop results until the cache fits its size."""
+
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def set_size(self, size):
+        """Change the number of results kept."""
+
+        with self.lock:
+            self.size = max(0, size)
+            self.evict()
+
+    def clear(self):
+        """Remove all results and reset the statistics."""
+
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Get `(hits, misses, count, size)`."""
+
+        with self.lock:
+            return self.hits, self.misses, len(self.entries), self.size
+
+
+query_cache = QueryCache()
+
+
+def get_excludes():
+    """Get the compiled exclusions from the `exclude_patterns` setting."""
+
+    patterns = sublime.load_settings("package_file_search.sublime-settings").get(
+        "exclude_patterns", DEFAULT_EXCLUDE_PATTERNS
+    )
+    return compile_excludes(tuple(patterns))
+
+
+def get_ignored_packages():
+    """Get the case folded names of the packages disabled by the `ignored_packages` preference."""
+
+    ignored = sublime.load_settings("Preferences.sublime-settings").get("ignored_packages", [])
+    return frozenset(fold_case(name) for name in ignored if isinstance(name, str))
+
+
+def get_count_setting(name, default):
+    """Get a setting that must be a positive whole number, falling back to `default` if it isn't one."""
+
+    value = sublime.load_settings("package_file_search.sublime-settings").get(name, default)
+    return value if isinstance(value, int) and not isinstance(value, bool) and value > 0 else default
+
+
+def get_index_workers():
+    """Get the number of workers to read packages with."""
+
+    return get_count_setting("index_workers", DEFAULT_INDEX_WORKERS)
+
+
+def get_max_results():
+    """Get the most results a search returns, or `None` for no limit."""
+
+    limit = sublime.load_settings("package_file_search.sublime-settings").get(
+        "max_results", DEFAULT_MAX_RESULTS
+    )
+    return limit if isinstance(limit, int) and limit > 0 else None
+
+
+_index = ResourceIndex()
+
+
+def get_index():
+    """Get the shared resource index, refreshing it if packages have changed."""
+
+    return _index.refresh()
+
+
+def get_catalog():
+    """Get the catalog of every package with a single scan of the package locations, without reading any package."""
+
+    return scan_catalog()
+
+
+def load_index():
+    """Load the shared resource index from the snapshot in the cache path."""
+
+    _index.cache_file = join(sublime.cache_path(), "PackageFileSearch", "resource_index.cache")
+    _index.load()
+
+
+def benchmark_index(workers=None, rounds=3):
+    """Time reading every package serially and with the workers after a warm-up pass, keeping the best of `rounds`."""
+
+    if workers is None:
+        workers = get_index_workers()
+    rounds = max(1, rounds)
+    packages = scan_catalog()
+    excludes = get_excludes()
+
+    # The warm-up pass fills the OS cache so neither mode pays for cold reads.
+    expected = [(r.path, r.resources) for r in ResourceIndex.read_packages(packages, workers, excludes)]
+    matched = True
+    times = {1: [], workers: []}
+    for _ in range(rounds):
+        for count in (1, workers):
+            start = time.time()
+            records = ResourceIndex.read_packages(packages, count, excludes)
+            times[count].append(time.time() - start)
+            matched = matched and [(r.path, r.resources) for r in records] == expected
+    return len(packages), min(times[1]), min(times[workers]), workers, rounds, matched
+
+
+def iter_package_contents(name, records=None):
+    """Yield the resources of a package relative to the package, once each, from its records if given."""
+
+    if records is None:
+        records = get_index().get_package(name)
+    seen = ResourceSet()
+    for record in records:
+        for res in record.resources:
+            if seen.add(res):
+                yield res
 
 
 def get_package_contents(pkg):
     """Get contents of package."""
 
     m = re.match(r"^Packages/([^/]*)/?$", pkg)
-    assert(m is not None)
+    assert m is not None
     pkg = m.group(1)
-    installed_pth, default_pth, user_pth = sublime_package_paths()
     content_files = []
     content_folders = []
 
-    get_folder_resources(join(user_pth, pkg), pkg, content_folders, content_files)
-    get_zip_resources(join(installed_pth, "%s.sublime-package" % pkg), pkg, content_folders, content_files)
-    get_zip_resources(join(default_pth, "%s.sublime-package" % pkg), pkg, content_folders, content_files)
+    for res in iter_package_contents(pkg):
+        package_name = "Packages/%s/%s" % (pkg, res)
+        if package_name.endswith('/'):
+            content_folders.append(package_name)
+        else:
+            content_files.append(package_name)
 
     return content_folders + content_files
 
 
-def get_packages():
-    """Get the package names."""
+class PackageFolder(object):
+    """A folder in a package tree."""
 
-    installed_pth, default_pth, user_pth = sublime_package_paths()
+    __slots__ = ("folders", "files", "_items")
+
+    def __init__(self):
+        """Initialize."""
+
+        self.folders = {}
+        self.files = []
+        self._items = None
+
+    def get(self, path):
+        """Get the folder at the given `/` separated path relative to this one, or `None`."""
 
-    installed_pkgs = scan_for_packages(installed_pth, archives=True)
-    default_pkgs = scan_for_packages(default_pth, archives=True)
-    user_pkgs = scan_for_packages(user_pth)
+        node = self
+        for part in path.split('/'):
+            if part:
+                node = node.folders.get(part)
+                if node is None:
+                    break
+        return node
+
+    def items(self):
+        """Get the sorted sub folders (with a trailing `/`) followed by the sorted files."""
+
+        if self._items is None:
+            self._items = sorted(f + '/' for f in self.folders) + sorted(self.files)
+        return self._items
+
+
+_trees = {}
+_trees_lock = threading.Lock()
+
+
+def get_package_tree(pkg, index=None):
+    """Get the contents of a package as a cached tree of folders and files."""
+
+    m = re.match(r"^Packages/([^/]*)/?$", pkg)
+    assert m is not None
+    name = m.group(1)
+    records = (index if index is not None else get_index()).get_package(name)
+    key = tuple((r.path, r.signature) for r in records)
+
+    with _trees_lock:
+        cached = _trees.get(fold_case(name))
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    root = PackageFolder()
+    for res in iter_package_contents(name, records):
+        parts = res.split('/')
+        node = root
+        for part in parts[:-1]:
+            if part:
+                folder = node.folders.get(part)
+                if folder is None:
+                    folder = node.folders[intern(part)] = PackageFolder()
+                node = folder
+        if parts[-1]:
+            node.files.append(intern(parts[-1]))
+
+    with _trees_lock:
+        _trees[fold_case(name)] = (key, root)
+    return root
+
+
+def get_packages(index=None):
+    """Get the package names, from an already refreshed index if given."""
 
     pkgs = []
-    for pkg_type in [user_pkgs, installed_pkgs, default_pkgs]:
-        for pkg in pkg_type:
-            name = packagename(pkg)
-            if not in_list(name, pkgs):
-                pkgs.append(name)
+    seen = ResourceSet()
+    for record in (index if index is not None else get_index()).get_records():
+        if seen.add(record.name):
+            pkgs.append(record.name)
 
     pkgs.sort()
 
     return pkgs
 
 
+class SearchResult(object):
+    """A file found by a Find All search."""
+
+    __slots__ = ("record", "resource")
+
+    def __init__(self, record, resource):
+        """Initialize."""
+
+        self.record = record
+        self.resource = resource
+
+    @property
+    def origin(self):
+        """Get the package location type."""
+
+        return self.record.origin
+
+    @property
+    def path(self):
+        """Get the path relative to the package location's folder, starting with the package folder or archive."""
+
+        return join(basename(self.record.path), normpath(self.resource))
+
+    def row(self):
+        """Get the `[path, origin]` quick panel row."""
+
+        return [self.path, self.record.origin]
+
+
 class PackageSearch(object):
-    """Search packages."""
+    """Search packages on the async thread, cancelling the search in progress."""
+
+    active_search = 0
+    progress_interval = 0.25
+    last_regex = None
 
     def pre_process(self, **kwargs):
         """Preprocess event."""
@@ -169,106 +826,225 @@ class PackageSearch(object):
         """Handle processing the file."""
 
     ################
-    # Qualify Files
+    # Progress
     ################
-    def find_files(self, files, file_path, pattern, settings, regex):
-        """Find the file that matches the pattern."""
+    def is_cancelled(self):
+        """Check if a newer search has replaced this one."""
 
-        for f in files:
-            if regex:
-                if re.match(pattern, f[0], re.IGNORECASE) is not None:
-                    settings.append([f[0].replace(file_path, "").lstrip("\\").lstrip("/"), f[1]])
+        return self.search_id != PackageSearch.active_search
+
+    def report_progress(self, count, done=False):
+        """Report the number of matches found so far."""
+
+        now = time.time()
+        if done or now - self.last_progress >= self.progress_interval:
+            self.last_progress = now
+            sublime.status_message(
+                "Package File Search: %d match%s%s" % (
+                    count, "" if count == 1 else "es",
+                    (" (max_results reached)" if self.truncated else "") if done else "..."
+                )
+            )
+
+    def show_results(self, items, on_done, on_highlight=None):
+        """Show the results in the quick panel from the main thread unless the search was cancelled."""
+
+        search_id = self.search_id
+
+        def show():
+            """Show quick panel."""
+
+            if search_id != PackageSearch.active_search:
+                return
+            if on_highlight is None:
+                self.window.show_quick_panel(items, on_done)
             else:
-                if fnmatch(f[0], pattern):
-                    settings.append([f[0].replace(file_path, "").lstrip("\\").lstrip("/"), f[1]])
+                self.window.show_quick_panel(items, on_done, 0, 0, on_highlight)
+
+        self.report_progress(len(items), done=True)
+        sublime.set_timeout(show, 0)
+
+    def show_matches(self, items):
+        """Show search results with the callbacks for the current mode."""
+
+        if self.find_all:
+            self.show_results(
+                [r.row() for r in items],
+                lambda x: self.process_file(x, settings=items)
+            )
+        else:
+            self.show_results(
+                items,
+                lambda x: self.process_file(x, settings=items),
+                lambda x: self.on_select(x, settings=items)
+            )
+
+    ################
+    # Collect
+    ################
+    def collect(self, rows):
+        """Pull rows from a search pipeline; returns `(items, truncated)`, or `None` if cancelled."""
+
+        limit = self.max_results
+        items = []
+        append = items.append
+        truncated = False
+        for row in rows:
+            if len(items) == limit:
+                truncated = True
+                break
+            append(row)
+            if not len(items) % 1000:
+                if self.is_cancelled():
+                    return None
+                self.report_progress(len(items))
+        if self.is_cancelled():
+            return None
+        return items, truncated
+
+    ################
+    # Qualify Files
+    ################
+    def find_files(self, record, files, matcher):
+        """Yield a result for each `(path, resource)` whose path matches the pattern."""
+
+        for path, res in files:
+            if matcher(path):
+                yield SearchResult(record, res)
 
     ################
     # Zipped
     ################
-    def walk_zip(self, settings, plugin, pattern, regex):
+    def walk_zip(self, record, matcher):
         """Walk the archived files within the plugin."""
 
-        with zipfile.ZipFile(plugin[0], 'r') as z:
-            zipped = [(join(basename(plugin[0]), normpath(fn)), plugin[1]) for fn in sorted(z.namelist())]
-            self.find_files(zipped, "", pattern, settings, regex)
+        archive = basename(record.path)
+        zipped = ((join(archive, normpath(fn)), fn) for fn in record.select(matcher))
+        return self.find_files(record, zipped, matcher)
 
-    def get_zip_packages(self, settings, file_path, package_type, pattern, regex=False):
-        """Get all the archived plugins in the plugin folder."""
+    def get_zip_packages(self, package_type, matcher):
+        """Walk all the archived plugins of the given type."""
 
-        plugins = [
-            (join(file_path, item), package_type) for item in listdir(file_path) if fnmatch(item, "*.sublime-package")
-        ]
-        for plugin in plugins:
-            self.walk_zip(settings, plugin, pattern.strip(), regex)
+        for record in self.index.get_records(package_type):
+            if self.is_cancelled():
+                return
+            for row in self.walk_zip(record, matcher):
+                yield row
 
-    def search_zipped_files(self, settings, pattern, regex):
+    def search_zipped_files(self, matcher):
         """Search the plugin folders for archived plugins."""
 
-        st_packages = sublime_package_paths()
-        self.get_zip_packages(settings, st_packages[0], "Installed", pattern, regex)
-        self.get_zip_packages(settings, st_packages[1], "Default", pattern, regex)
+        return chain(
+            self.get_zip_packages(ORIGIN_INSTALLED, matcher),
+            self.get_zip_packages(ORIGIN_DEFAULT, matcher)
+        )
 
     ################
     # Unzipped
     ################
-    def walk(self, settings, file_path, plugin, package_type, pattern, regex=False):
+    def walk(self, record, matcher):
         """Walk the files within the plugin."""
 
-        for base, dirs, files in walk(plugin):
-            files = [(join(base, f), package_type) for f in files]
-            self.find_files(files, file_path, pattern, settings, regex)
+        files = ((normpath(join(record.path, f)), f) for f in record.select(matcher) if not f.endswith('/'))
+        return self.find_files(record, files, matcher)
 
-    def get_unzipped_packages(self, settings, file_path, package_type, pattern, regex=False):
-        """Get all of the plugins in the plugin folder."""
+    def get_unzipped_packages(self, matcher):
+        """Walk all of the plugins in the plugin folder."""
 
-        plugins = [join(file_path, item) for item in listdir(file_path) if isdir(join(file_path, item))]
-        for plugin in plugins:
-            self.walk(settings, file_path, plugin, package_type, pattern.strip(), regex)
+        for record in self.index.get_records(ORIGIN_PACKAGES):
+            if self.is_cancelled():
+                return
+            for row in self.walk(record, matcher):
+                yield row
 
-    def search_unzipped_files(self, settings, pattern, regex):
+    def search_unzipped_files(self, matcher):
         """Search the plugin folders for unzipped packages."""
 
-        st_packages = sublime_package_paths()
-        self.get_unzipped_packages(settings, st_packages[2], "Packages", pattern, regex)
+        return self.get_unzipped_packages(matcher)
 
     ################
     # Search All
     ################
     def find_raw(self, pattern, regex=False):
-        """Search all packages regardless of whether it is being overridden."""
+        """Search all packages; returns `([SearchResult, ...], truncated)`, or `None` if cancelled."""
 
-        settings = []
-        self.search_unzipped_files(settings, pattern, regex)
-        self.zipped_idx = len(settings)
-        self.search_zipped_files(settings, pattern, regex)
-
-        self.window.show_quick_panel(
-            settings,
-            lambda x: self.process_file(x, settings=settings)
-        )
+        matcher = compile_pattern(pattern.strip(), regex)
+        return self.collect(chain(self.search_unzipped_files(matcher), self.search_zipped_files(matcher)))
 
     ################
     # Search Override
     ################
+    def iter_effective(self, effective, matcher, regex):
+        """Yield the active resources that match."""
+
+        if regex:
+            # Regular expressions match the full resource path.
+            return matcher.ifilter(effective)
+        # Wild cards match the file name like `sublime.find_resources`.
+        return (t for t in effective if matcher(t[t.rfind('/') + 1:]))
+
     def find(self, pattern, regex):
-        """Search just the active packages.  Not the ones that have been overridden."""
+        """Search just the active packages; returns `(resources, truncated)`, or `None` if cancelled."""
+
+        matcher = compile_pattern(pattern, regex)
+        index = self.index
+        generation = index.generation
+        last = PackageSearch.last_regex
+        if regex and last is not None and last[0] == generation and is_regex_refinement(last[1], pattern):
+            # Anything the refined pattern matches was matched by the last one.
+            effective = last[2]
+        elif regex:
+            effective = index.get_effective_resources()
+        else:
+            effective = ("Packages/%s/%s" % (name, res) for name, _, res in index.iter_effective(matcher))
+        result = self.collect(self.iter_effective(effective, matcher, regex))
+        if regex and result is not None and not result[1]:
+            # Only complete results can be refined.
+            PackageSearch.last_regex = (generation, pattern, result[0])
+        return result
 
-        resources = []
-        if not regex:
-            resources = sublime.find_resources(pattern)
+    ################
+    # Fuzzy
+    ################
+    def find_fuzzy(self, pattern):
+        """Rank the files against a fuzzy query and show only the best matches."""
+
+        limit = get_count_setting("fuzzy_max_results", DEFAULT_FUZZY_RESULTS)
+        entries, paths = self.index.get_lowercase_paths(effective=not self.find_all)
+        if self.is_cancelled():
+            return
+        ranked = FuzzyMatcher(pattern).rank(paths, limit)
+
+        if self.find_all:
+            self.show_matches([SearchResult(entries[i][1], entries[i][2]) for i in ranked])
         else:
-            temp = sublime.find_resources("*")
-            for t in temp:
-                if re.match(pattern, t, re.IGNORECASE) is not None:
-                    resources.append(t)
-
-        self.window.show_quick_panel(
-            resources,
-            lambda x: self.process_file(x, settings=resources),
-            0,
-            0,
-            lambda x: self.on_select(x, settings=resources)
-        )
+            self.show_matches(["Packages/%s/%s" % (entries[i][0], entries[i][2]) for i in ranked])
+
+    def run_search(self, search_id, pattern, regex, fuzzy=False):
+        """Run the search."""
+
+        self.search_id = search_id
+        self.last_progress = 0
+        self.truncated = False
+        if self.is_cancelled():
+            return
+        self.index = get_index()
+        self.max_results = get_max_results()
+        try:
+            if fuzzy:
+                self.find_fuzzy(pattern)
+                return
+            key = query_cache.make_key(pattern, regex, self.find_all, self.index.generation, self.max_results)
+            result = query_cache.get(key)
+            if result is None:
+                result = self.find(pattern, regex) if not self.find_all else self.find_raw(pattern, regex)
+                if result is None:
+                    return
+                query_cache.put(key, result)
+            items, self.truncated = result
+            self.show_matches(items)
+        except re.error as e:
+            sublime.error_message("Package File Search: invalid regular expression `%s`\n\n%s" % (pattern, str(e)))
 
     def search(self, **kwargs):
         """Search packages."""
@@ -276,9 +1052,9 @@ class PackageSearch(object):
         kwargs = self.pre_process(**kwargs)
         pattern = kwargs.get("pattern", None)
         regex = kwargs.get("regex", False)
+        fuzzy = kwargs.get("fuzzy", False)
         self.find_all = kwargs.get("find_all", False)
 
-        if not self.find_all:
-            self.find(pattern, regex)
-        else:
-            self.find_raw(pattern, regex)
+        PackageSearch.active_search += 1
+        search_id = PackageSearch.active_search
+        sublime.set_timeout_async(lambda: self.run_search(search_id, pattern, regex, fuzzy), 0)
@@ -0,0 +1,403 @@
+"""
+Lightweight zip central directory reader.
+
+Licensed under MIT
+Copyright (c) 2012 Isaac Muse <isaacmuse@gmail.com>
+"""
+import codecs
+import mmap
+import os
+import struct
+import threading
+import zlib
+import zipfile
+from collections import OrderedDict
+
+__all__ = (
+    "ZipEntry",
+    "ZipReader",
+    "MemberCache",
+    "member_cache",
+    "read_member",
+    "read_member_head",
+    "decode_content",
+    "end_on_line"
+)
+
+END_CENTRAL_DIR = b"PK\x05\x06"
+END_CENTRAL_DIR_STRUCT = struct.Struct("<4s4H2LH")
+ZIP64_END_CENTRAL_DIR = b"PK\x06\x06"
+ZIP64_END_CENTRAL_DIR_STRUCT = struct.Struct("<4sQ2H2L4Q")
+ZIP64_LOCATOR = b"PK\x06\x07"
+ZIP64_LOCATOR_STRUCT = struct.Struct("<4sLQL")
+CENTRAL_DIR = b"PK\x01\x02"
+CENTRAL_DIR_STRUCT = struct.Struct("<4s6H3L5H2L")
+LOCAL_HEADER = b"PK\x03\x04"
+LOCAL_HEADER_STRUCT = struct.Struct("<4s5H3L2H")
+MAX_COMMENT = 0xFFFF
+ZIP64_EXTRA = 0x0001
+FLAG_ENCRYPTED = 0x1
+FLAG_UTF8 = 0x800
+DEFAULT_CACHE_BUDGET = 16 * 1024 * 1024
+
+
+class ZipEntry(object):
+    """An archive member as described by the central directory."""
+
+    __slots__ = ("name", "offset", "compressed_size", "size", "crc", "method", "flags")
+
+    def __init__(self, name, offset, compressed_size, size, crc, method, flags):
+        """Initialize."""
+
+        self.name = name
+        self.offset = offset
+        self.compressed_size = compressed_size
+        self.size = size
+        self.crc = crc
+        self.method = method
+        self.flags = flags
+
+    def is_dir(self):
+        """Check if the entry is a folder."""
+
+        return self.name.endswith('/')
+
+
+class ZipReader(object):
+    """Read an archive's central directory from a memory mapped archive."""
+
+    def __init__(self, path):
+        """Open the archive and read the central directory."""
+
+        self.path = path
+        self.entries = []
+        self._lookup = None
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise zipfile.BadZipfile("File is empty: %s" % path)
+        try:
+            self._read_central_dir()
+        except struct.error:
+            self.close()
+            raise zipfile.BadZipfile("Truncated archive: %s" % path)
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        """Enter context."""
+
+        return self
+
+    def __exit__(self, *args):
+        """Exit context."""
+
+        self.close()
+
+    def close(self):
+        """Release the mapped archive."""
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _find_end_central_dir(self):
+        """Locate the end of central directory and return `(position, count, size, offset)`."""
+
+        mm = self._map
+        start = max(0, len(mm) - END_CENTRAL_DIR_STRUCT.size - MAX_COMMENT)
+        pos = mm.rfind(END_CENTRAL_DIR, start)
+        if pos == -1 or pos + END_CENTRAL_DIR_STRUCT.size > len(mm):
+            raise zipfile.BadZipfile("File is not a zip file: %s" % self.path)
+        count, size, offset = END_CENTRAL_DIR_STRUCT.unpack_from(mm, pos)[4:7]
+
+        # ZIP64 archives keep the real values in a separate record
+        loc = pos - ZIP64_LOCATOR_STRUCT.size
+        if loc >= 0 and mm[loc:loc + 4] == ZIP64_LOCATOR:
+            zip64_pos = ZIP64_LOCATOR_STRUCT.unpack_from(mm, loc)[2]
+            if mm[zip64_pos:zip64_pos + 4] != ZIP64_END_CENTRAL_DIR:
+                raise zipfile.BadZipfile("Corrupt ZIP64 end of central directory: %s" % self.path)
+            count, size, offset = ZIP64_END_CENTRAL_DIR_STRUCT.unpack_from(mm, zip64_pos)[7:10]
+            pos = zip64_pos
+        return pos, count, size, offset
+
+    @staticmethod
+    def _read_zip64_extra(extra, size, compressed_size, offset):
+        """Replace overflowed values with those found in the ZIP64 extra field."""
+
+        i = 0
+        while i + 4 <= len(extra):
+            tag, length = struct.unpack_from("<2H", extra, i)
+            if tag == ZIP64_EXTRA:
+                values = list(struct.unpack_from("<%dQ" % (length // 8), extra, i + 4))
+                if size == 0xFFFFFFFF:
+                    size = values.pop(0)
+                if compressed_size == 0xFFFFFFFF:
+                    compressed_size = values.pop(0)
+                if offset == 0xFFFFFFFF:
+                    offset = values.pop(0)
+                break
+            i += 4 + length
+        return size, compressed_size, offset
+
+    def _read_central_dir(self):
+        """Parse the central directory entries."""
+
+        end_pos, count, cd_size, cd_offset = self._find_end_central_dir()
+
+        # Data may be prepended to the archive (self extracting archives)
+        concat = end_pos - cd_size - cd_offset
+        cd_start = cd_offset + concat
+        if concat < 0 or cd_start < 0:
+            raise zipfile.BadZipfile("Bad central directory offset: %s" % self.path)
+        data = self._map[cd_start:cd_start + cd_size]
+
+        entries = []
+        append = entries.append
+        pos = 0
+        header_size = CENTRAL_DIR_STRUCT.size
+        unpack = CENTRAL_DIR_STRUCT.unpack_from
+        while pos + header_size <= len(data):
+            (
+                sig, _, _, flags, method, _, _, crc, compressed_size, size,
+                name_len, extra_len, comment_len, _, _, _, offset
+            ) = unpack(data, pos)
+            if sig != CENTRAL_DIR:
+                raise zipfile.BadZipfile("Bad central directory entry: %s" % self.path)
+            pos += header_size
+            raw_name = data[pos:pos + name_len]
+            name = raw_name.decode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+            if 0xFFFFFFFF in (size, compressed_size, offset):
+                size, compressed_size, offset = self._read_zip64_extra(
+                    data[pos + name_len:pos + name_len + extra_len], size, compressed_size, offset
+                )
+            pos += name_len + extra_len + comment_len
+            append(ZipEntry(name, offset + concat, compressed_size, size, crc, method, flags))
+
+        if len(entries) != count:
+            raise zipfile.BadZipfile("Central directory is truncated: %s" % self.path)
+        self.entries = entries
+
+    def names(self):
+        """Get the member names in central directory order."""
+
+        return [e.name for e in self.entries]
+
+    def get(self, name):
+        """Get the entry for a member name or `None` if it is not in the archive."""
+
+        if self._lookup is None:
+            self._lookup = {e.name: e for e in self.entries}
+        return self._lookup.get(name)
+
+    def _get_entry(self, entry):
+        """Resolve a member name to its entry."""
+
+        if not isinstance(entry, ZipEntry):
+            name = entry
+            entry = self.get(name)
+            if entry is None:
+                raise KeyError("There is no item named %r in the archive" % name)
+        if entry.flags & FLAG_ENCRYPTED:
+            raise RuntimeError("File %r is encrypted" % entry.name)
+        return entry
+
+    def _data_offset(self, entry):
+        """Get the offset of a member's data after its local header."""
+
+        header = LOCAL_HEADER_STRUCT.unpack_from(self._map, entry.offset)
+        if header[0] != LOCAL_HEADER:
+            raise zipfile.BadZipfile("Bad local header for %r: %s" % (entry.name, self.path))
+        return entry.offset + LOCAL_HEADER_STRUCT.size + header[9] + header[10]
+
+    def iter_chunks(self, entry, chunk_size=64 * 1024):
+        """Decompress a member incrementally, yielding chunks of data."""
+
+        entry = self._get_entry(entry)
+        start = self._data_offset(entry)
+        end = start + entry.compressed_size
+        if entry.method == zipfile.ZIP_STORED:
+            for pos in range(start, end, chunk_size):
+                yield self._map[pos:min(pos + chunk_size, end)]
+        elif entry.method == zipfile.ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-15)
+            for pos in range(start, end, chunk_size):
+                data = decompressor.decompress(self._map[pos:min(pos + chunk_size, end)])
+                if data:
+                    yield data
+            data = decompressor.flush()
+            if data:
+                yield data
+        else:
+            yield self.read(entry)
+
+    def read(self, entry):
+        """Read and decompress a member given its entry or name."""
+
+        entry = self._get_entry(entry)
+        mm = self._map
+        start = self._data_offset(entry)
+        raw = mm[start:start + entry.compressed_size]
+
+        if entry.method == zipfile.ZIP_STORED:
+            data = raw
+        elif entry.method == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(raw, -15)
+        else:
+            # Uncommon compression; let zipfile handle it.
+            with zipfile.ZipFile(self.path, 'r') as z:
+                return z.read(entry.name)
+
+        if zlib.crc32(data) & 0xFFFFFFFF != entry.crc:
+            raise zipfile.BadZipfile("Bad CRC-32 for file %r: %s" % (entry.name, self.path))
+        return data
+
+
+class MemberCache(object):
+    """Least recently used cache of decompressed archive members within a byte budget."""
+
+    def __init__(self, budget=DEFAULT_CACHE_BUDGET):
+        """Initialize."""
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get a cached member or `None`."""
+
+        with self.lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        """Cache a member, evicting the least recently used members to stay in budget."""
+
+        with self.lock:
+            if len(data) > self.budget:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = data
+            self.size += len(data)
+            self.evict()
+
+    def evict(self):
+        """Evict members until the cache fits the budget."""
+
+        while self.size > self.budget and self.entries:
+            self.size -= len(self.entries.popitem(last=False)[1])
+
+    def set_budget(self, budget):
+        """Change the byte budget."""
+
+        with self.lock:
+            self.budget = budget
+            self.evict()
+
+    def clear(self):
+        """Remove all members and reset the statistics."""
+
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Get `(hits, misses, count, size, budget)`."""
+
+        with self.lock:
+            return self.hits, self.misses, len(self.entries), self.size, self.budget
+
+
+member_cache = MemberCache()
+
+
+def read_member(path, name, cache=member_cache):
+    """Read a member of an archive through the member cache."""
+
+    st = os.stat(path)
+    key = (path, st.st_mtime, st.st_size, name)
+    data = cache.get(key)
+    if data is None:
+        with ZipReader(path) as z:
+            data = z.read(name)
+        cache.put(key, data)
+    return data
+
+
+def read_member_head(path, name, limit, cache=member_cache):
+    """Read at most `limit` bytes from the start of an archive member; returns `(data, size)`."""
+
+    with ZipReader(path) as z:
+        entry = z.get(name)
+        if entry is None:
+            raise KeyError("There is no item named %r in the archive" % name)
+        if entry.size > limit:
+            chunks = []
+            count = 0
+            for chunk in z.iter_chunks(entry):
+                chunks.append(chunk)
+                count += len(chunk)
+                if count >= limit:
+                    break
+            return b''.join(chunks)[:limit], entry.size
+    return read_member(path, name, cache), entry.size
+
+
+def decode_content(text):
+    """Decode archived content; returns the text and the matching Sublime encoding name."""
+
+    for bom, encoding, st_encoding in (
+        (codecs.BOM_UTF8, "utf_8_sig", "UTF-8 with BOM"),
+        (codecs.BOM_UTF16_LE, "utf_16", "UTF-16 LE with BOM"),
+        (codecs.BOM_UTF16_BE, "utf_16", "UTF-16 BE with BOM")
+    ):
+        if text.startswith(bom):
+            try:
+                return text.decode(encoding), st_encoding
+            except UnicodeDecodeError:
+                break
+
+    for encoding, st_encoding in (
+        ("utf_8", "UTF-8"),
+        ("cp1252", "Western (Windows 1252)"),
+        ("latin_1", "Western (ISO 8859-1)")
+    ):
+        try:
+            return text.decode(encoding), st_encoding
+        except UnicodeDecodeError:
+            pass
+
+
+def end_on_line(text):
+    """Cut partial content after its last whole line, keeping UTF-16 code units whole."""
+
+    newline = b'\n'
+    step = 1
+    if text.startswith(codecs.BOM_UTF16_LE):
+        newline, step = b'\n\x00', 2
+    elif text.startswith(codecs.BOM_UTF16_BE):
+        newline, step = b'\x00\n', 2
+    end = text.rfind(newline)
+    while end != -1 and end % step:
+        end = text.rfind(newline, 0, end + 1)
+    if end == -1:
+        return text[:len(text) - len(text) % step]
+    return text[:end + len(newline)]
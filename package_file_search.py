@@ -6,17 +6,20 @@ Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
 """
 import sublime
 import sublime_plugin
-from os.path import join, basename, exists, dirname, normpath
-from os import mkdir, chmod, rmdir, remove
-import stat
+from os.path import join, exists, dirname, normpath
 import re
+import time
 import zipfile
-import tempfile
-import shutil
 from .lib import package_search as pfs
+from .lib.zip_reader import member_cache, read_member, read_member_head, decode_content, end_on_line
+from .lib.matcher import compile_pattern
+from .lib.content_search import ContentSearch, get_search_targets
+from .lib.content_index import ContentIndex, query_trigrams
+from .lib.extract import extract_package
+from .lib.package_audit import find_drift, find_duplicates
 
 FIND_ALL_MODE = False
-EXCLUDES = [".svn", ".hg", ".git", ".DS_Store"]
+CONTENT_INDEX = ContentIndex()
 
 
 def log(s):
@@ -25,109 +28,115 @@ def log(s):
     print("PackageFileSearch: %s" % s)
 
 
-def get_encoding(view):
-    """Get view encoding."""
+def find_syntax(file_name, content):
+    """Find the syntax for a file from its name and first line, if Sublime supports it."""
 
-    mapping = [
-        ("with BOM", ""),
-        ("Windows", "cp"),
-        ("-", "_"),
-        (" ", "")
-    ]
-    encoding = view.encoding()
-    orig = encoding
-    m = re.match(r'.+\((.*)\)', encoding)
-    if m is not None:
-        encoding = m.group(1)
+    syntax = None
+    if hasattr(sublime, "find_syntax_for_file"):
+        first_line = content[:content.find('\n')] if '\n' in content[:4096] else content[:4096]
+        found = sublime.find_syntax_for_file(file_name, first_line)
+        if found is not None:
+            syntax = found.path
+    return syntax
 
-    for item in mapping:
-        encoding = encoding.replace(item[0], item[1])
 
-    return ("utf_8", "UTF-8") if encoding in ["Undefined", "Hexidecimal"] else (encoding, orig)
+class ArchivedFileLoader(object):
+    """Load archived files on the async thread and show them in read only views."""
 
+    active = 0
 
-def on_rm_error(func, path, exc_info):
-    """Handle windows error that occurs sometimes on remove."""
+    @classmethod
+    def load(cls, archives, resource, line=None, full=False, view=None):
+        """Load a member from the first archive in `archives` that has it."""
 
-    if func in (rmdir, remove):
-        chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)  # 0777
-        try:
-            func(path)
-        except Exception:
-            if sublime.platform() == "windows":
-                # Why are you being so stubborn windows?
-                # This situation only randomly occurs
-                log("Windows is being stubborn...go through rmdir to remove temp folder")
-                import subprocess
-                cmd = ["rmdir", "/S", path]
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                process = subprocess.Popen(
-                    cmd,
-                    startupinfo=startupinfo,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    stdin=subprocess.PIPE,
-                    shell=False
+        cls.active += 1
+        load_id = cls.active
+        win = sublime.active_window()
+        sublime.set_timeout_async(lambda: cls.read(load_id, win, archives, resource, line, full, view), 0)
+
+    @classmethod
+    def is_cancelled(cls, load_id):
+        """Check if a newer load has replaced this one."""
+
+        return load_id != cls.active
+
+    @classmethod
+    def read(cls, load_id, win, archives, resource, line, full, view):
+        """Decompress and decode the member on the async thread."""
+
+        settings = sublime.load_settings("package_file_search.sublime-settings")
+        limit = None if full else int(float(settings.get("archive_preview_size", 2)) * 1024 * 1024)
+        for pth in archives:
+            if cls.is_cancelled(load_id):
+                return
+            try:
+                if limit is None:
+                    text = read_member(pth, resource)
+                    size = len(text)
+                else:
+                    text, size = read_member_head(pth, resource, limit)
+            except KeyError:
+                continue
+            except (zipfile.BadZipfile, IOError, OSError, RuntimeError) as e:
+                log("Could not read %s from %s: %s" % (resource, pth, str(e)))
+                return
+
+            preview = len(text) < size
+            if preview:
+                text = end_on_line(text)
+            content, st_encoding = decode_content(text)
+            if preview and line is not None and content.count('\n') < line:
+                # The line to show isn't in the preview.
+                content, st_encoding = decode_content(read_member(pth, resource))
+                preview = False
+            if cls.is_cancelled(load_id):
+                return
+
+            file_name = normpath(join(pth, resource))
+            content = content.replace('\r', '')
+            syntax = find_syntax(file_name, content) if view is None else None
+            sublime.set_timeout(
+                lambda: cls.show(
+                    load_id, win, view, file_name, content, st_encoding, syntax, line,
+                    {"archive": pth, "resource": resource, "size": size} if preview else None
+                ),
+                0
+            )
+            return
+
+    @classmethod
+    def show(cls, load_id, win, view, file_name, content, st_encoding, syntax, line, preview):
+        """Show the loaded content on the main thread."""
+
+        if cls.is_cancelled(load_id):
+            return
+        if view is None:
+            if win is None:
+                return
+            view = win.open_file(file_name)
+            if syntax is not None:
+                view.set_syntax_file(syntax)
+        elif not view.is_valid():
+            return
+        view.set_encoding(st_encoding)
+        view.settings().set("package_file_search_preview", preview)
+        if preview is None:
+            view.erase_status("package_file_search")
+        else:
+            view.set_status(
+                "package_file_search",
+                "Preview of %.1f MB file (Package File Search: Load Full Archived File)" % (
+                    preview["size"] / (1024.0 * 1024.0)
                 )
-                returncode = process.returncode
-                if returncode:
-                    log("Why won't you play nice, Windows!")
-                    log(process.communicate()[0])
-                    raise
-            else:
-                raise
-    else:
-        raise
+            )
+        WriteArchivedPackageContentCommand.bfr = content
+        sublime.set_timeout(lambda: view.run_command("write_archived_package_content", {"line": line}), 0)
 
 
-def open_package_file_zip(pth, resource):
+def open_package_file_zip(pth, resource, line=None):
     """Open file in zip packages."""
 
-    found = False
-    win = sublime.active_window()
-    with zipfile.ZipFile(pth, 'r') as z:
-        for item in z.infolist():
-            if resource == item.filename:
-                found = True
-                text = z.read(z.getinfo(resource))
-                file_name = normpath(join(pth, resource))
-
-                # Unpack the file in a temporary location
-                d = tempfile.mkdtemp(prefix="pkgfs")
-                with open(join(d, basename(file_name)), "wb") as f:
-                    f.write(text)
-
-                # Open and then close the file in a view in order
-                # to let sublime guess encoding and syntax
-                view = win.open_file(f.name)
-                encoding, st_encoding = get_encoding(view)
-                win.focus_view(view)
-                win.run_command("close_file")
-                syntax = view.settings().get('syntax')
-                shutil.rmtree(d, onerror=on_rm_error)
-
-                # When a file is opened from disk, you can't rename the
-                # the path location.  If you try and use new_file,
-                # you can give it a nice file path name, but the tab
-                # will be huge.  If you use open_file, with a bogus path,
-                # the view will be created with the desired filepath, and
-                # it will properly display the basename as the tab name,
-                # it will just report an issue reading the file in the console.
-                # Reopen a new view and configure it with the
-                # syntax and name and give the view a friendly name
-                # opposed to an ugly temp directory
-                view = win.open_file(file_name)
-                view.set_syntax_file(syntax)
-                view.set_encoding(st_encoding)
-                try:
-                    WriteArchivedPackageContentCommand.bfr = text.decode(encoding).replace('\r', '')
-                except Exception:
-                    view.set_encoding("UTF-8")
-                    WriteArchivedPackageContentCommand.bfr = text.decode("utf-8").replace('\r', '')
-                sublime.set_timeout(lambda: view.run_command("write_archived_package_content"), 0)
-                break
-    return found
+    ArchivedFileLoader.load([pth], resource, line)
 
 
 def open_package_file(pth):
@@ -139,18 +148,14 @@ def open_package_file(pth):
     zip_resource = '/'.join(parts)
     installed, default, user = pfs.sublime_package_paths()
     user_res = normpath(join(user, resource))
-    installed_res = join(installed, zip_pkg)
-    default_res = join(default, zip_pkg)
     if exists(user_res):
         win = sublime.active_window()
         if win is not None:
             win.open_file(user_res)
     else:
-        found = False
-        if exists(installed_res):
-            found = open_package_file_zip(installed_res, zip_resource)
-        if not found and exists(default_res):
-            found = open_package_file_zip(default_res, zip_resource)
+        archives = [a for a in (join(installed, zip_pkg), join(default, zip_pkg)) if exists(a)]
+        if archives:
+            ArchivedFileLoader.load(archives, zip_resource)
 
 
 class WriteArchivedPackageContentCommand(sublime_plugin.TextCommand):
@@ -158,20 +163,40 @@ class WriteArchivedPackageContentCommand(sublime_plugin.TextCommand):
 
     bfr = None
 
-    def run(self, edit):
+    def run(self, edit, line=None):
         """Run command."""
         cls = WriteArchivedPackageContentCommand
         if cls.bfr is not None:
             self.view.set_read_only(False)
             self.view.set_scratch(True)
             self.view.replace(edit, sublime.Region(0, self.view.size()), cls.bfr)
+            pt = 0 if line is None else self.view.text_point(line - 1, 0)
             sels = self.view.sel()
             sels.clear()
-            sels.add(0)
+            sels.add(pt)
+            if line is not None:
+                self.view.show_at_center(pt)
             cls.bfr = None
             self.view.set_read_only(True)
 
 
+class PackageFileSearchLoadFullCommand(sublime_plugin.TextCommand):
+    """Replace the preview of a large archived file with the whole file."""
+
+    def run(self, edit):
+        """Run command."""
+
+        preview = self.view.settings().get("package_file_search_preview")
+        if preview is not None:
+            sublime.status_message("Package File Search: loading %s..." % preview["resource"])
+            ArchivedFileLoader.load([preview["archive"]], preview["resource"], full=True, view=self.view)
+
+    def is_enabled(self):
+        """Check if the view shows a preview."""
+
+        return self.view.settings().get("package_file_search_preview") is not None
+
+
 class PackageFileSearchNavCommand(sublime_plugin.WindowCommand):
     """Naviage packages."""
 
@@ -195,24 +220,11 @@ class PackageFileSearchNavCommand(sublime_plugin.WindowCommand):
             else:
                 target = join(target, child)
         target = target.replace("\\", '/')
-        folders = []
-        files = []
         if not target.endswith('/'):
             open_package_file(target)
             return
-        for c in pfs.get_package_contents(package_folder):
-            if not c.startswith(target):
-                continue
-            parts = c.replace(target, "").split('/')
-            if parts[0] in EXCLUDES:
-                continue
-            if len(parts) > 1 and parts[0] + '/' not in folders:
-                folders.append(parts[0] + '/')
-            elif len(parts) == 1 and parts[0] not in files:
-                files.append(parts[0])
-        folders.sort()
-        files.sort()
-        folder_items = [".."] + folders + files
+        folder = self.tree.get(target[len(package_folder):])
+        folder_items = [".."] + (folder.items() if folder is not None else [])
         self.window.show_quick_panel(
             folder_items,
             lambda x: self.folder_select(x, folder_items, target, package_folder)
@@ -223,6 +235,7 @@ class PackageFileSearchNavCommand(sublime_plugin.WindowCommand):
 
         if value > -1:
             pkg = self.packages[value]
+            self.tree = pfs.get_package_tree("Packages/%s/" % pkg, self.index)
             sublime.set_timeout(lambda: self.nav_package("Packages/%s/" % pkg, None, "Packages/%s/" % pkg), 100)
 
     def show_packages(self):
@@ -234,11 +247,26 @@ class PackageFileSearchNavCommand(sublime_plugin.WindowCommand):
                 self.open_pkg
             )
 
+    def load_packages(self):
+        """Refresh the index on the async thread, then show the packages from the main thread."""
+
+        # Refresh once and navigate the same snapshot of the packages.
+        index = pfs.get_index()
+        packages = pfs.get_packages(index)
+
+        def show():
+            """Show the packages."""
+
+            self.index = index
+            self.packages = packages
+            self.show_packages()
+
+        sublime.set_timeout(show, 0)
+
     def run(self):
         """Run command."""
 
-        self.packages = pfs.get_packages()
-        self.show_packages()
+        sublime.set_timeout_async(self.load_packages, 0)
 
 
 class _GetPackageFilesInputCommand(sublime_plugin.WindowCommand):
@@ -251,10 +279,27 @@ class _GetPackageFilesInputCommand(sublime_plugin.WindowCommand):
 
         regex = False
         if pattern != "":
+            m = re.match(r"^[ \t]*~(.*)$", pattern)
+            if m is not None:
+                self.window.run_command(
+                    "package_file_search",
+                    {
+                        "pattern": m.group(1),
+                        "fuzzy": True,
+                        "find_all": find_all
+                    }
+                )
+                return
             m = re.match(r"^[ \t]*`(.*)`[ \t]*$", pattern)
             if m is not None:
                 regex = True
                 pattern = m.group(1)
+            try:
+                # Compiled matchers are memoized, so the search reuses this one.
+                compile_pattern(pattern.strip() if find_all else pattern, regex)
+            except re.error as e:
+                sublime.error_message("Package File Search: invalid regular expression `%s`\n\n%s" % (pattern, str(e)))
+                return
             self.window.run_command(
                 "package_file_search",
                 {
@@ -365,25 +410,44 @@ class PackageFileSearchExtractCommand(sublime_plugin.WindowCommand):
     """Extract zipped package."""
 
     def extract(self, value, packages):
-        """Extract files from the zip file."""
+        """Extract files from the zip file in the background."""
 
         if value > -1:
             pkg = packages[value]
-            name = pfs.packagename(pkg)
-            dest = join(sublime.packages_path(), name)
-            if not exists(dest):
-                mkdir(dest)
-            with zipfile.ZipFile(pkg) as z:
-                z.extractall(dest)
+            sublime.set_timeout_async(lambda: self.extract_package(pkg), 0)
+
+    def extract_package(self, pkg):
+        """Extract the package on the async thread, reporting progress in the status bar."""
+
+        workers = pfs.get_count_setting("extract_workers", 4)
+        dest = join(sublime.packages_path(), pkg.name)
+        last = [0.0]
+
+        def progress(done, total):
+            """Report how many files have been handled."""
+
+            now = time.time()
+            if now - last[0] >= 0.25:
+                last[0] = now
+                sublime.status_message("Package File Search: extracting %s (%d of %d)..." % (pkg.name, done, total))
+
+        try:
+            written, unchanged = extract_package(pkg.path, dest, workers, progress)
+        except (zipfile.BadZipfile, IOError, OSError, RuntimeError) as e:
+            sublime.error_message("Package File Search: could not extract %s\n\n%s" % (pkg.name, str(e)))
+            return
+        sublime.status_message(
+            "Package File Search: extracted %s (%d written, %d unchanged)" % (pkg.name, written, unchanged)
+        )
 
     def run(self):
         """Run command."""
 
-        defaults, installed, _ = pfs.get_packages_location()
-        packages = defaults + installed
+        catalog = pfs.get_catalog()
+        packages = [e for origin in (pfs.ORIGIN_DEFAULT, pfs.ORIGIN_INSTALLED) for e in catalog if e.origin == origin]
         if len(packages):
             self.window.show_quick_panel(
-                [pfs.packagename(pkg) for pkg in packages],
+                [pkg.name for pkg in packages],
                 lambda x: self.extract(x, packages)
             )
 
@@ -400,33 +464,16 @@ class _PackageSearchCommand(sublime_plugin.WindowCommand, pfs.PackageSearch):
 class PackageFileSearchCommand(_PackageSearchCommand):
     """Search packages with file pattern."""
 
-    def open_zip_file(self, fn):
-        """Open zip file."""
-
-        file_name = None
-        zip_package = None
-        zip_file = None
-        for zp in pfs.sublime_package_paths():
-            items = fn.replace('\\', '/').split('/')
-            zip_package = items.pop(0)
-            zip_file = '/'.join(items)
-            if exists(join(zp, zip_package)):
-                zip_package = join(zp, zip_package)
-                file_name = join(zp, fn)
-                break
-
-        if file_name is not None:
-            open_package_file_zip(zip_package, zip_file)
-
     def process_file(self, value, settings):
         """Process the file."""
 
         if value > -1:
             if self.find_all:
-                if value >= self.zipped_idx:
-                    self.open_zip_file(settings[value][0])
+                result = settings[value]
+                if result.record.archived:
+                    open_package_file_zip(result.record.path, result.resource)
                 else:
-                    self.window.open_file(join(self.packages, settings[value][0]))
+                    self.window.open_file(join(result.record.path, normpath(result.resource)))
             else:
                 self.window.run_command("open_file", {"file": settings[value].replace("Packages", "${packages}", 1)})
 
@@ -456,6 +503,227 @@ class PackageFileSearchColorSchemeCommand(_PackageSearchCommand):
         return {"pattern": "*.tmTheme"}
 
 
+class PackageFileSearchBenchmarkCommand(sublime_plugin.WindowCommand):
+    """Compare reading packages serially against reading them with the worker pool."""
+
+    def benchmark(self):
+        """Run the benchmark."""
+
+        count, serial, parallel, workers, rounds, matched = pfs.benchmark_index()
+        log(
+            "Read %d packages with a warm OS cache (best of %d rounds): serial %.3fs, %d workers %.3fs (%.1fx)" % (
+                count, rounds, serial, workers, parallel, serial / parallel if parallel else 1.0
+            )
+        )
+        if not matched:
+            log("Serial and parallel reads found different resources; a package may have changed during the run")
+        sublime.status_message("Package File Search: benchmark complete (see console)")
+
+    def run(self):
+        """Run command."""
+
+        sublime.status_message("Package File Search: benchmarking package indexing...")
+        sublime.set_timeout_async(self.benchmark, 0)
+
+
+def show_report(window, title, text):
+    """Show a report in a new scratch view on the main thread."""
+
+    def show():
+        """Create the view."""
+
+        view = window.new_file()
+        view.set_name(title)
+        view.set_scratch(True)
+        view.run_command("append", {"characters": text})
+        view.set_read_only(True)
+
+    sublime.set_timeout(show, 0)
+
+
+class PackageFileSearchDriftCommand(sublime_plugin.WindowCommand):
+    """Report which unpacked override files differ from the archived files they override."""
+
+    def report(self):
+        """Check the overrides on the async thread and show the report."""
+
+        start = time.time()
+        index = pfs.get_index()
+        overrides = []
+        for record in index.get_records(pfs.ORIGIN_PACKAGES):
+            # Like `open_package_file`, an installed archive is preferred over a default one.
+            archives = [r for r in index.get_package(record.name) if r.archived]
+            if archives:
+                overrides.append((record.name, record.path, record.resources, archives[0].path))
+        results = find_drift(overrides, pfs.get_index_workers())
+        elapsed = time.time() - start
+
+        lines = []
+        checked = 0
+        modified = 0
+        for drift in results:
+            checked += drift.unchanged + len(drift.modified)
+            modified += len(drift.modified)
+            if not drift.modified and not drift.added:
+                continue
+            lines.append("%s (overrides %s)" % (drift.name, drift.archive))
+            lines.extend("    modified: %s" % res for res in drift.modified)
+            lines.extend("    added:    %s" % res for res in drift.added)
+            lines.append("    %d unchanged" % drift.unchanged)
+            lines.append("")
+        header = "Checked %d override files in %d packages in %.2fs: %d modified\n\n" % (
+            checked, len(results), elapsed, modified
+        )
+        show_report(self.window, "Package Override Drift", header + "\n".join(lines))
+
+    def run(self):
+        """Run command."""
+
+        sublime.status_message("Package File Search: checking overrides...")
+        sublime.set_timeout_async(self.report, 0)
+
+
+class PackageFileSearchDuplicatesCommand(sublime_plugin.WindowCommand):
+    """Report identical files shipped by more than one package."""
+
+    def report(self):
+        """Find the duplicates on the async thread and show the report."""
+
+        start = time.time()
+        locations = [(r.name, r.path, r.archived, r.resources) for r in pfs.get_index().get_records()]
+        groups, files, hashed = find_duplicates(locations, pfs.get_index_workers(), fold=pfs.fold_case)
+        elapsed = time.time() - start
+
+        lines = []
+        for group in groups:
+            lines.append(
+                "%d copies in %d packages of %d bytes (CRC-32 %08x)" % (
+                    len(group.members), group.packages, group.size, group.crc
+                )
+            )
+            for name, pth, res in group.members:
+                lines.append("    Packages/%s/%s    [%s]" % (name, res, pth))
+            lines.append("")
+        header = "Checked %d files in %.2fs (read %d loose files): %d duplicate groups, %.1f KB in extra copies\n\n" % (
+            files, elapsed, hashed, len(groups), sum(g.wasted for g in groups) / 1024.0
+        )
+        show_report(self.window, "Package Duplicate Files", header + "\n".join(lines))
+
+    def run(self):
+        """Run command."""
+
+        sublime.status_message("Package File Search: looking for duplicate files...")
+        sublime.set_timeout_async(self.report, 0)
+
+
+class PackageFileSearchContentCommand(sublime_plugin.WindowCommand):
+    """Search the content of package files, including files inside archives."""
+
+    active_search = 0
+
+    def open_match(self, value, matches):
+        """Open the selected match at its line."""
+
+        if value > -1:
+            match = matches[value]
+            if match.record.archived:
+                open_package_file_zip(match.record.path, match.resource, match.line)
+            else:
+                self.window.open_file(
+                    "%s:%d" % (join(match.record.path, match.resource), match.line), sublime.ENCODED_POSITION
+                )
+
+    def search(self, search_id, pattern, regex, find_all):
+        """Search package content on the async thread."""
+
+        cls = PackageFileSearchContentCommand
+        settings = sublime.load_settings("package_file_search.sublime-settings")
+        try:
+            searcher = ContentSearch(
+                pattern, regex,
+                limit=pfs.get_count_setting("content_search_limit", 1000),
+                workers=pfs.get_count_setting("content_search_workers", 4),
+                cancelled=lambda: search_id != cls.active_search
+            )
+        except re.error as e:
+            sublime.error_message("Package File Search: invalid regular expression `%s`\n\n%s" % (pattern, str(e)))
+            return
+
+        sublime.status_message("Package File Search: searching package content...")
+        index = pfs.get_index()
+        targets = get_search_targets(index, find_all)
+        if settings.get("content_index", False):
+            targets = CONTENT_INDEX.filter_targets(targets, query_trigrams(pattern, regex))
+            # Packages whose postings are stale were searched in full; index them for next time.
+            CONTENT_INDEX.update_in_background(index.get_records)
+        matches = searcher.run(targets)
+        if search_id != cls.active_search:
+            return
+
+        items = [
+            [m.location, ("[%s] %s" % (m.record.origin, m.text)) if find_all else m.text] for m in matches
+        ]
+        sublime.status_message(
+            "Package File Search: %d matching line%s in %d files" % (
+                len(matches), "" if len(matches) == 1 else "s", searcher.files_searched
+            )
+        )
+        if items:
+            sublime.set_timeout(
+                lambda: self.window.show_quick_panel(items, lambda x: self.open_match(x, matches)), 0
+            )
+
+    def find_content(self, pattern):
+        """Start a content search."""
+
+        regex = False
+        if pattern != "":
+            m = re.match(r"^[ \t]*`(.*)`[ \t]*$", pattern)
+            if m is not None:
+                regex = True
+                pattern = m.group(1)
+            cls = PackageFileSearchContentCommand
+            cls.active_search += 1
+            search_id = cls.active_search
+            find_all = FIND_ALL_MODE
+            sublime.set_timeout_async(lambda: self.search(search_id, pattern, regex, find_all), 0)
+
+    def run(self):
+        """Prompt user for the text to search for."""
+
+        self.window.show_input_panel(
+            "Content Pattern: ",
+            "",
+            self.find_content,
+            None,
+            None
+        )
+
+
+class PackageFileSearchCacheStatsCommand(sublime_plugin.ApplicationCommand):
+    """Show cache statistics."""
+
+    def run(self):
+        """Run command."""
+
+        hits, misses, count, size, budget = member_cache.stats()
+        total = hits + misses
+        log(
+            "Archive member cache: %d hits, %d misses (%.0f%% hit rate), %d members, %.1f of %.1f MB" % (
+                hits, misses, (hits * 100.0 / total) if total else 0.0, count,
+                size / (1024.0 * 1024.0), budget / (1024.0 * 1024.0)
+            )
+        )
+        hits, misses, count, size = pfs.query_cache.stats()
+        total = hits + misses
+        log(
+            "Search result cache: %d hits, %d misses (%.0f%% hit rate), %d of %d searches" % (
+                hits, misses, (hits * 100.0 / total) if total else 0.0, count, size
+            )
+        )
+        sublime.status_message("Package File Search: cache statistics printed to the console")
+
+
 class TogglePackageSearchFindAllModeCommand(sublime_plugin.ApplicationCommand):
     """Toggle find all mode."""
 
@@ -467,8 +735,30 @@ class TogglePackageSearchFindAllModeCommand(sublime_plugin.ApplicationCommand):
         sublime.status_message("Package File Search: Find All = %s" % str(FIND_ALL_MODE))
 
 
+def update_content_index():
+    """Bring the content index up to date on its own thread if it is enabled."""
+
+    if sublime.load_settings("package_file_search.sublime-settings").get("content_index", False):
+        CONTENT_INDEX.update_in_background(lambda: pfs.get_index().get_records())
+
+
+def on_settings_change():
+    """Apply settings that can change while the plugin is loaded."""
+
+    settings = sublime.load_settings("package_file_search.sublime-settings")
+    member_cache.set_budget(int(settings.get("member_cache_size", 16)) * 1024 * 1024)
+    pfs.query_cache.set_size(int(settings.get("query_cache_size", 32)))
+
+
 def plugin_loaded():
     """Load plugin."""
 
     global FIND_ALL_MODE
-    FIND_ALL_MODE = sublime.load_settings("package_file_search.sublime-settings").get("find_all_by_default", False)
+    settings = sublime.load_settings("package_file_search.sublime-settings")
+    FIND_ALL_MODE = settings.get("find_all_by_default", False)
+    settings.clear_on_change("package_file_search")
+    settings.add_on_change("package_file_search", on_settings_change)
+    on_settings_change()
+    pfs.load_index()
+    CONTENT_INDEX.cache_folder = join(sublime.cache_path(), "PackageFileSearch", "content_index")
+    update_content_index()
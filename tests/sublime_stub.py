@@ -0,0 +1,72 @@
+"""Minimal stand in for the `sublime` module so the library can be tested outside of Sublime Text."""
+import os
+
+root = ""
+settings = {}
+
+
+class Settings(dict):
+    """Settings object stand in."""
+
+    def get(self, key, default=None):
+        """Get a setting."""
+
+        return dict.get(self, key, default)
+
+    def set(self, key, value):
+        """Set a setting."""
+
+        self[key] = value
+
+
+def load_settings(name):
+    """Get the named settings."""
+
+    return settings.setdefault(name, Settings())
+
+
+def platform():
+    """Get the platform."""
+
+    return "linux"
+
+
+def installed_packages_path():
+    """Get the installed archives location."""
+
+    return os.path.join(root, "Installed Packages")
+
+
+def executable_path():
+    """Get the executable, next to the default archives location."""
+
+    return os.path.join(root, "App", "sublime_text")
+
+
+def packages_path():
+    """Get the unpacked packages location."""
+
+    return os.path.join(root, "Packages")
+
+
+def cache_path():
+    """Get the cache location."""
+
+    return os.path.join(root, "Cache")
+
+
+def status_message(msg):
+    """Ignore status messages."""
+
+
+def error_message(msg):
+    """Ignore error messages."""
+
+
+def set_timeout(callback, delay=0):
+    """Run the callback right away."""
+
+    callback()
+
+
+set_timeout_async = set_timeout
@@ -0,0 +1,146 @@
+"""Test content index."""
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from lib import content_index
+from tests.util import Record
+
+
+class TestQueryTrigrams(unittest.TestCase):
+    """Test which trigrams a query requires."""
+
+    def test_literal(self):
+        """Test literal queries."""
+
+        self.assertEqual(content_index.query_trigrams("Show_O"), {"sho", "how", "ow_", "w_o"})
+        self.assertEqual(content_index.query_trigrams("ab"), set())
+
+    def test_regex(self):
+        """Test that only required plain text in a regex is used."""
+
+        self.assertEqual(content_index.query_trigrams(r"^import \w+$", True), {"imp", "mpo", "por", "ort", "rt "})
+        self.assertEqual(content_index.query_trigrams(r"abcd?", True), {"abc"})
+        self.assertEqual(content_index.query_trigrams(r"(optional)?[abc]xy", True), set())
+        self.assertEqual(content_index.query_trigrams(r"first|second", True), set())
+        self.assertEqual(content_index.query_trigrams(r"(?x) spaced out", True), set())
+
+        # Repeat counts and multi-character escapes are not plain text.
+        query = content_index.query_trigrams
+        self.assertEqual(query(r"foo\d{100}", True), {"foo"})
+        self.assertEqual(query(r"ab{10,20}", True), set())
+        self.assertEqual(query(r"abc{,2}d", True), set())
+        self.assertEqual(query(r"foo\x41bcd", True), {"foo", "bcd"})
+        self.assertEqual(query(r"\u0062cde", True), {"cde"})
+        self.assertEqual(query(r"\N{LATIN SMALL LETTER B}cde", True), {"cde"})
+        self.assertEqual(query(r"a\101bcd", True), {"bcd"})
+        self.assertEqual(query(r"[\]abc]def", True), {"def"})
+        self.assertEqual(query(r"x{y}", True), {"x{y", "{y}"})
+
+
+class TestContentIndex(unittest.TestCase):
+    """Test indexing packages and narrowing search targets."""
+
+    def setUp(self):
+        """Create an archived package and an unpacked package."""
+
+        self.tempdir = tempfile.mkdtemp(prefix="pkgfs_test")
+        self.archive = os.path.join(self.tempdir, "Archived.sublime-package")
+        with zipfile.ZipFile(self.archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("a.py", "window.run_command('show_overlay')\n")
+            z.writestr("b.py", "print('nothing here')\n")
+            z.writestr("c.bin", b"\0show_overlay")
+        self.folder = os.path.join(self.tempdir, "Loose")
+        os.makedirs(self.folder)
+        self.loose_file = os.path.join(self.folder, "d.py")
+        with open(self.loose_file, 'w') as f:
+            f.write("nothing\n")
+        self.archived = Record("Archived", "Installed", self.archive, ["a.py", "b.py", "c.bin"], (1, 2))
+        self.loose = Record("Loose", "Packages", self.folder, ["d.py"], ((self.folder, 1),))
+
+    def tearDown(self):
+        """Remove the packages."""
+
+        shutil.rmtree(self.tempdir)
+
+    def targets(self):
+        """Get search targets for both packages."""
+
+        return [
+            ("Archived", self.archived, ["a.py", "b.py", "c.bin"]),
+            ("Loose", self.loose, ["d.py"])
+        ]
+
+    def test_filter(self):
+        """Test that only candidate files are searched and indexes are reloaded from the cache."""
+
+        index = content_index.ContentIndex(os.path.join(self.tempdir, "cache"))
+        index.update([self.archived, self.loose])
+        trigrams = content_index.query_trigrams("show_overlay")
+        self.assertEqual([t[2] for t in index.filter_targets(self.targets(), trigrams)], [["a.py"]])
+
+        cached = content_index.ContentIndex(os.path.join(self.tempdir, "cache"))
+        cached.update([self.archived, self.loose])
+        self.assertEqual([t[2] for t in cached.filter_targets(self.targets(), trigrams)], [["a.py"]])
+
+        # A changed archive signature leaves the package unfiltered until it is indexed again.
+        self.archived.signature = (3, 4)
+        self.assertEqual(len(index.filter_targets(self.targets(), trigrams)[0][2]), 3)
+
+    def test_edited_loose_file(self):
+        """Test that editing an unpacked file re-indexes its package."""
+
+        index = content_index.ContentIndex()
+        index.update([self.loose])
+        trigrams = content_index.query_trigrams("show_overlay")
+        self.assertEqual(index.filter_targets(self.targets()[1:], trigrams), [])
+
+        time.sleep(0.01)
+        with open(self.loose_file, 'w') as f:
+            f.write("show_overlay and more\n")
+        index.update([self.loose])
+        self.assertEqual([t[2] for t in index.filter_targets(self.targets()[1:], trigrams)], [["d.py"]])
+
+    def test_changed_resources(self):
+        """Test that postings built from another resource list don't hide files they never saw."""
+
+        with zipfile.ZipFile(self.archive, 'a') as z:
+            z.writestr("docs/b.md", "show_overlay\n")
+        trigrams = content_index.query_trigrams("show_overlay")
+        index = content_index.ContentIndex()
+        index.update([self.archived])
+        self.archived.resources = ["a.py", "b.py", "c.bin", "docs/", "docs/b.md"]
+        targets = [("Archived", self.archived, ["a.py", "b.py", "c.bin", "docs/b.md"])]
+        self.assertEqual(len(index.filter_targets(targets, trigrams)[0][2]), 4)
+
+        index.update([self.archived])
+        self.assertEqual([t[2] for t in index.filter_targets(targets, trigrams)], [["a.py", "docs/b.md"]])
+
+    def test_background_update(self):
+        """Test that searches are not narrowed while the index is updating on its own thread."""
+
+        index = content_index.ContentIndex()
+        trigrams = content_index.query_trigrams("show_overlay")
+        started = threading.Event()
+        release = threading.Event()
+
+        def get_records():
+            """Hold the update until the test has searched."""
+
+            started.set()
+            release.wait(5)
+            return [self.archived, self.loose]
+
+        self.assertTrue(index.update_in_background(get_records))
+        started.wait(5)
+        self.assertFalse(index.update_in_background(get_records))
+        self.assertEqual(index.filter_targets(self.targets(), trigrams), self.targets())
+        release.set()
+        for _ in range(500):
+            if not index.building:
+                break
+            time.sleep(0.01)
+        self.assertEqual([t[2] for t in index.filter_targets(self.targets(), trigrams)], [["a.py"]])
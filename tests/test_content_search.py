@@ -0,0 +1,73 @@
+"""Test content search."""
+import unittest
+import os
+import shutil
+import tempfile
+import zipfile
+from lib import content_search
+from tests.util import Record
+
+
+class TestContentSearch(unittest.TestCase):
+    """Test searching loose and archived package files."""
+
+    def setUp(self):
+        """Create a loose package and an archived package."""
+
+        self.tempdir = tempfile.mkdtemp(prefix="pkgfs_test")
+        self.folder = os.path.join(self.tempdir, "Loose")
+        os.makedirs(os.path.join(self.folder, "sub"))
+        with open(os.path.join(self.folder, "sub", "plugin.py"), 'w') as f:
+            f.write("import sublime\n\nwindow.run_command('show_overlay')  # show_overlay\n")
+        with open(os.path.join(self.folder, "image.png"), 'wb') as f:
+            f.write(b"\x89PNG\0\0show_overlay")
+        self.archive = os.path.join(self.tempdir, "Archived.sublime-package")
+        with zipfile.ZipFile(self.archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("Default.sublime-keymap", '[\n    {"keys": ["f1"], "command": "Show_Overlay"}\n]\n')
+            z.writestr("binary.bin", b"\0show_overlay")
+            z.writestr("many.txt", "show_overlay\n" * 50)
+
+        self.targets = [
+            ("Loose", Record("Loose", "Packages", self.folder, []), ["sub/plugin.py", "image.png"]),
+            (
+                "Archived", Record("Archived", "Installed", self.archive, []),
+                ["Default.sublime-keymap", "binary.bin", "many.txt"]
+            )
+        ]
+
+    def tearDown(self):
+        """Remove the packages."""
+
+        shutil.rmtree(self.tempdir)
+
+    def test_search(self):
+        """Test that lines match once, binaries are skipped, and line numbers are right."""
+
+        matches = content_search.ContentSearch("show_overlay", workers=2).run(self.targets[:1] + [
+            (self.targets[1][0], self.targets[1][1], self.targets[1][2][:2])
+        ])
+        self.assertEqual(
+            [m.location for m in matches],
+            ["Packages/Loose/sub/plugin.py:3", "Packages/Archived/Default.sublime-keymap:2"]
+        )
+        self.assertEqual(matches[1].text, '{"keys": ["f1"], "command": "Show_Overlay"}')
+
+    def test_limit(self):
+        """Test that the search stops at the limit."""
+
+        matches = content_search.ContentSearch("show_overlay", limit=10, workers=1).run(self.targets)
+        self.assertEqual(len(matches), 10)
+
+    def test_regex(self):
+        """Test regular expression searches."""
+
+        matches = content_search.ContentSearch(r"^import \w+$", regex=True).run(self.targets)
+        self.assertEqual([m.location for m in matches], ["Packages/Loose/sub/plugin.py:1"])
+
+    def test_missing_member(self):
+        """Test that a missing archived member is skipped without abandoning the rest of the archive."""
+
+        search = content_search.ContentSearch("show_overlay", workers=1)
+        matches = search.run([(self.targets[1][0], self.targets[1][1], ["missing.txt", "Default.sublime-keymap"])])
+        self.assertEqual([m.location for m in matches], ["Packages/Archived/Default.sublime-keymap:2"])
+        self.assertEqual(search.files_searched, 1)
@@ -0,0 +1,68 @@
+"""Test package extraction."""
+import unittest
+import os
+import shutil
+import tempfile
+import zipfile
+from lib import extract
+
+
+class TestExtract(unittest.TestCase):
+    """Test extracting archives and skipping unchanged files."""
+
+    def setUp(self):
+        """Create a test archive."""
+
+        self.tempdir = tempfile.mkdtemp(prefix="pkgfs_test")
+        self.archive = os.path.join(self.tempdir, "Test.sublime-package")
+        self.dest = os.path.join(self.tempdir, "Test")
+        with zipfile.ZipFile(self.archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("plugin.py", "import sublime\n")
+            z.writestr(zipfile.ZipInfo("empty/"), "")
+            for i in range(10):
+                z.writestr("sub/file%d.txt" % i, "content %d\n" % i)
+            z.writestr("../escape.txt", "outside\n")
+
+    def tearDown(self):
+        """Remove the test archive."""
+
+        shutil.rmtree(self.tempdir)
+
+    def read(self, *parts):
+        """Read an extracted file."""
+
+        with open(os.path.join(self.dest, *parts), 'rb') as f:
+            return f.read()
+
+    def test_extract(self):
+        """Test that members are written once and then left alone until they differ."""
+
+        progress = []
+        result = extract.extract_package(self.archive, self.dest, progress=lambda done, total: progress.append(total))
+        self.assertEqual(result, (11, 0))
+        self.assertEqual(len(progress), 12)
+        self.assertEqual(self.read("sub", "file3.txt"), b"content 3\n")
+        self.assertTrue(os.path.isdir(os.path.join(self.dest, "empty")))
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir, "escape.txt")))
+
+        with open(os.path.join(self.dest, "sub", "file3.txt"), 'wb') as f:
+            f.write(b"content X\n")
+        with open(os.path.join(self.dest, "plugin.py"), 'wb') as f:
+            f.write(b"changed\n")
+        self.assertEqual(extract.extract_package(self.archive, self.dest, workers=1), (2, 9))
+        self.assertEqual(self.read("sub", "file3.txt"), b"content 3\n")
+        self.assertEqual(self.read("plugin.py"), b"import sublime\n")
+
+    def test_cancelled(self):
+        """Test that a cancelled extraction writes nothing."""
+
+        self.assertEqual(extract.extract_package(self.archive, self.dest, cancelled=lambda: True), (0, 0))
+        self.assertEqual(os.listdir(self.dest), [])
+
+    def test_file_crc32(self):
+        """Test that file CRCs match the archive's."""
+
+        extract.extract_package(self.archive, self.dest)
+        with zipfile.ZipFile(self.archive) as z:
+            info = z.getinfo("sub/file5.txt")
+        self.assertEqual(extract.file_crc32(os.path.join(self.dest, "sub", "file5.txt")), info.CRC)
@@ -0,0 +1,153 @@
+"""Test matcher."""
+import unittest
+import re
+import time
+from fnmatch import fnmatch
+from lib import matcher
+
+PATHS = [
+    "Default.sublime-package/Default (Windows).sublime-keymap",
+    "Default.sublime-package/Preferences.sublime-settings",
+    "Theme - Default/Default.sublime-theme",
+    "Color Scheme - Default/Monokai.tmTheme",
+    "Python/Python.tmLanguage",
+    "Python/Python.sublime-syntax",
+    "PackageFileSearch/README.md",
+    "PackageFileSearch/lib/package_search.py",
+    "PackageFileSearch/lib/__init__.py",
+    "*literal*",
+    ""
+]
+
+
+class TestMatcher(unittest.TestCase):
+    """Test that compiled matchers agree with `fnmatch` and `re`."""
+
+    def test_glob(self):
+        """Test wild card patterns, including the literal fast paths."""
+
+        patterns = (
+            "*", "**", "*.tmTheme", "*tmLanguage", "*readme*", "*README*", "Python/*",
+            "Python/Python.tmLanguage", "*.sublime-*", "*/lib/*.py", "*[Ww]indows*", "*.py?", "", "\\*literal\\*"
+        )
+        for pattern in patterns:
+            m = matcher.compile_pattern(pattern)
+            expected = [p for p in PATHS if fnmatch(p, pattern)]
+            self.assertEqual([p for p in PATHS if m(p)], expected, pattern)
+            self.assertEqual(m.filter(PATHS), expected, pattern)
+
+    def test_regex(self):
+        """Test regular expression patterns."""
+
+        for pattern in (r".*\.tmtheme", r"python/", r"(?:theme|color).*default", r".*\.py$"):
+            m = matcher.compile_pattern(pattern, True)
+            expected = [p for p in PATHS if re.match(pattern, p, re.IGNORECASE)]
+            self.assertEqual(m.filter(PATHS), expected, pattern)
+
+    def test_memoized(self):
+        """Test that compiling the same pattern returns the same matcher."""
+
+        self.assertIs(matcher.compile_pattern("*.py"), matcher.compile_pattern("*.py"))
+        self.assertIsNot(matcher.compile_pattern("python"), matcher.compile_pattern("python", True))
+
+    def test_bad_regex(self):
+        """Test that invalid regular expressions raise `re.error`."""
+
+        self.assertRaises(re.error, matcher.compile_pattern, "(unclosed", True)
+
+    def test_lookup_keys(self):
+        """Test which glob patterns can be answered from the index lookups."""
+
+        self.assertEqual(matcher.compile_pattern("*.tmTheme").extension, ".tmtheme")
+        self.assertEqual(matcher.compile_pattern("Preferences.sublime-settings").name, "preferences.sublime-settings")
+        for pattern in ("*tmLanguage", "*.tar.gz", "*readme*", "*/x.py", "*.py?"):
+            m = matcher.compile_pattern(pattern)
+            self.assertIsNone(m.extension, pattern)
+            self.assertIsNone(m.name, pattern)
+
+    def test_fuzzy_rank(self):
+        """Test that fuzzy matches are filtered and ranked best first."""
+
+        paths = [
+            "default/default (windows).sublime-keymap",
+            "default/side_bar.py",
+            "python/default.sublime-keymap",
+            "color scheme - default/monokai.tmtheme",
+            "default/find in files.sublime-menu"
+        ]
+        fuzzy = matcher.FuzzyMatcher("dfkm")
+        self.assertEqual(matcher.FuzzyMatcher("sidebar").rank(paths, 10), [1])
+        ranked = fuzzy.rank(paths, 10)
+        self.assertEqual(set(ranked), {0, 2, 3})
+        self.assertEqual(ranked[-1], 3)
+        self.assertEqual(fuzzy.rank(paths, 1), ranked[:1])
+        self.assertEqual(matcher.FuzzyMatcher("mono kai").rank(paths, 10), [3])
+        self.assertIsNone(fuzzy.score("default/side_bar.py"))
+        self.assertEqual(matcher.FuzzyMatcher("").rank(paths, 2), [0, 1])
+        self.assertGreater(
+            matcher.FuzzyMatcher("keymap").score("python/default.sublime-keymap"),
+            matcher.FuzzyMatcher("keymap").score("keyboard/map.py")
+        )
+
+    def test_fuzzy_no_backtracking(self):
+        """Test that a near miss on a long run of one character is rejected quickly."""
+
+        start = time.time()
+        self.assertEqual(matcher.FuzzyMatcher("sssssssssx").rank(["s" * 42, "s" * 20 + "x"], 10), [1])
+        self.assertEqual(matcher.FuzzyMatcher("aaaaaaaab").rank(["a" * 40], 10), [])
+        self.assertLess(time.time() - start, 1)
+
+    def test_regex_refinement(self):
+        """Test which regular expressions only narrow the previous one."""
+
+        for previous, pattern in (
+            (r"packages/", r"packages/default/"), (r".*\.py", r".*\.py$"), (r".*\.", r".*\.tm"),
+            (r"p.{2}", r"p.{2}k")
+        ):
+            self.assertTrue(matcher.is_regex_refinement(previous, pattern), pattern)
+            expected = [p for p in PATHS if re.match(pattern, p, re.IGNORECASE)]
+            self.assertEqual(matcher.compile_pattern(pattern, True).filter(
+                matcher.compile_pattern(previous, True).filter(PATHS)
+            ), expected, pattern)
+
+        for previous, pattern in (
+            (r"packages/", r"python/"),
+            (r"packages/x", r"packages/x*"),
+            (r"a|b", r"a|bc"),
+            (r"abc", r"abc|xyz"),
+            (r"abc", r"abc(?:x|y)"),
+            (r"(?x)a", r"(?x)a b"),
+            (r"a{2", r"a{2}"),
+            (r"\}a{2", r"\}a{2}"),
+            (r"a\{2", r"a\{2}"),
+            (r"\x4", r"\x41"),
+            (r"(a)\1", r"(a)\10")
+        ):
+            self.assertFalse(matcher.is_regex_refinement(previous, pattern), pattern)
+
+    def test_ifilter(self):
+        """Test that lazy filtering matches filtering and stops when the caller does."""
+
+        for pattern, regex in (("*", False), ("*.py", False), ("*theme*", False), (r".*\.py$", True)):
+            m = matcher.compile_pattern(pattern, regex)
+            self.assertEqual(list(m.ifilter(iter(PATHS))), m.filter(PATHS), pattern)
+
+        paths = iter(PATHS)
+        next(matcher.compile_pattern("*").ifilter(paths))
+        self.assertEqual(list(paths), PATHS[1:])
+
+    def test_excludes(self):
+        """Test that exclusions match whole names and any part of a path."""
+
+        excludes = matcher.compile_excludes(matcher.DEFAULT_EXCLUDE_PATTERNS)
+        self.assertIs(excludes, matcher.compile_excludes(matcher.DEFAULT_EXCLUDE_PATTERNS))
+        for path in ("sub/.git/HEAD", ".hg", "lib/module.pyc", "a/.DS_Store"):
+            self.assertTrue(excludes.excludes_path(path), path)
+        for path in ("sub/.gitignore", "x.git/a", "module.py", "pyc/a"):
+            self.assertFalse(excludes.excludes_path(path), path)
+
+        names = [".git", "src", "cache.pyo", ".gitattributes"]
+        excludes.prune(names)
+        self.assertEqual(names, ["src", ".gitattributes"])
+        self.assertFalse(matcher.compile_excludes(()).excludes_name(".git"))
+        self.assertTrue(matcher.compile_excludes(("build?",)).excludes_name("build1"))
@@ -0,0 +1,84 @@
+"""Test package audits."""
+import unittest
+import os
+import shutil
+import tempfile
+import zipfile
+from lib import package_audit
+
+
+class TestPackageAudit(unittest.TestCase):
+    """Test comparing package files using archive metadata."""
+
+    def setUp(self):
+        """Create an archived package and an unpacked override of it."""
+
+        self.tempdir = tempfile.mkdtemp(prefix="pkgfs_test")
+        self.archive = os.path.join(self.tempdir, "Pkg.sublime-package")
+        with zipfile.ZipFile(self.archive, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("same.py", "x = 1\n")
+            z.writestr("resized.py", "x = 1\n")
+            z.writestr("edited.py", "x = 1\n")
+        self.folder = os.path.join(self.tempdir, "Pkg")
+        os.makedirs(os.path.join(self.folder, "sub"))
+        for name, content in (
+            ("same.py", "x = 1\n"), ("resized.py", "x = 10\n"), ("edited.py", "x = 2\n"), ("sub/new.py", "y\n")
+        ):
+            with open(os.path.join(self.folder, name), 'w') as f:
+                f.write(content)
+        self.resources = ["edited.py", "resized.py", "same.py", "sub/", "sub/new.py"]
+
+    def tearDown(self):
+        """Remove the test packages."""
+
+        shutil.rmtree(self.tempdir)
+
+    def test_drift(self):
+        """Test that modified and added override files are found."""
+
+        overrides = [("Pkg", self.folder, self.resources, self.archive)] * 2
+        overrides.append(("Bad", self.folder, self.resources, os.path.join(self.tempdir, "missing.sublime-package")))
+        results = package_audit.find_drift(overrides)
+        self.assertEqual(len(results), 2)
+        for drift in results:
+            self.assertEqual(drift.modified, ["edited.py", "resized.py"])
+            self.assertEqual(drift.added, ["sub/new.py"])
+            self.assertEqual(drift.unchanged, 1)
+        self.assertEqual(package_audit.find_drift(overrides, cancelled=lambda: True), [])
+
+    def test_duplicates(self):
+        """Test that identical files are grouped across packages and only colliding loose files are read."""
+
+        other = os.path.join(self.tempdir, "Other.sublime-package")
+        with zipfile.ZipFile(other, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr("theme.tmTheme", "x = 1\n")
+            z.writestr("empty.txt", "")
+            z.writestr("unique.txt", "unique\n")
+        locations = [
+            ("Pkg", self.folder, False, self.resources),
+            ("Pkg", self.archive, True, ["edited.py", "resized.py", "same.py"]),
+            ("Other", other, True, ["empty.txt", "theme.tmTheme", "unique.txt"])
+        ]
+        groups, files, hashed = package_audit.find_duplicates(locations)
+        # `resized.py` shares its size with `unique.txt`, `sub/new.py` shares it with nothing.
+        self.assertEqual((files, hashed), (10, 3))
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0].size, 6)
+        # The override of its own archive is not an extra copy.
+        self.assertEqual(groups[0].wasted, 6)
+        self.assertEqual(
+            [(m[0], m[2]) for m in groups[0].members],
+            [
+                ("Other", "theme.tmTheme"), ("Pkg", "same.py"),
+                ("Pkg", "edited.py"), ("Pkg", "resized.py"), ("Pkg", "same.py")
+            ]
+        )
+
+        # Copies within one package are not duplicates.
+        self.assertEqual(package_audit.find_duplicates(locations[:2])[0], [])
+
+        # Package names differing only in case are one package only where the platform folds case.
+        locations = [("pkg", self.archive, True, ["same.py"]), ("Pkg", self.folder, False, ["same.py"])]
+        self.assertEqual(len(package_audit.find_duplicates(locations)[0]), 1)
+        self.assertEqual(package_audit.find_duplicates(locations, fold=lambda name: name.lower())[0], [])
+        self.assertIsNone(package_audit.find_duplicates(locations, cancelled=lambda: True))
@@ -0,0 +1,327 @@
+"""Test the resource index and package searches."""
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from tests import sublime_stub
+sys.modules.setdefault("sublime", sublime_stub)
+from lib import package_search as ps  # noqa: E402
+
+
+def touch_later(pth):
+    """Move the modified time of a path forward so it is seen as changed."""
+
+    st = os.stat(pth)
+    os.utime(pth, (st.st_atime, st.st_mtime + 10))
+
+
+class PackageTestCase(unittest.TestCase):
+    """Create unpacked, installed, and default packages in a fake Sublime install."""
+
+    def setUp(self):
+        """Create the packages."""
+
+        self.tempdir = tempfile.mkdtemp(prefix="pkgfs_test")
+        sublime_stub.root = self.tempdir
+        sublime_stub.settings.clear()
+        ps.PackageSearch.last_regex = None
+
+        self.write("Packages/Pkg/plugin.py", "import sublime\n")
+        self.write("Packages/Pkg/sub/util.py", "")
+        self.write("Packages/Pkg/.git/config", "")
+        self.zip("Installed Packages/Pkg.sublime-package", ["plugin.py", "theme.tmTheme"])
+        self.zip("Installed Packages/Other.sublime-package", ["other.py"])
+        self.zip("App/Packages/Other.sublime-package", ["other.py", "default_only.py"])
+        self.zip("App/Packages/Default.sublime-package", ["Default.sublime-keymap"])
+        self.cache_file = os.path.join(self.tempdir, "Cache", "resource_index.cache")
+
+    def tearDown(self):
+        """Remove the packages."""
+
+        shutil.rmtree(self.tempdir)
+
+    def path(self, name):
+        """Get the full path of a file in the fake install."""
+
+        return os.path.join(self.tempdir, *name.split('/'))
+
+    def write(self, name, content):
+        """Write a loose file."""
+
+        pth = self.path(name)
+        if not os.path.exists(os.path.dirname(pth)):
+            os.makedirs(os.path.dirname(pth))
+        with open(pth, 'w') as f:
+            f.write(content)
+
+    def zip(self, name, members):
+        """Write an archive holding the given members."""
+
+        pth = self.path(name)
+        if not os.path.exists(os.path.dirname(pth)):
+            os.makedirs(os.path.dirname(pth))
+        with zipfile.ZipFile(pth, 'w') as z:
+            for member in members:
+                z.writestr(member, member)
+
+    def get_index(self):
+        """Get a refreshed index backed by the test snapshot."""
+
+        return ps.ResourceIndex(self.cache_file).refresh()
+
+
+class TestResourceIndex(PackageTestCase):
+    """Test refreshing, saving, and loading the resource index."""
+
+    def test_refresh(self):
+        """Test that every package is read once and unchanged packages are kept."""
+
+        index = self.get_index()
+        self.assertEqual(
+            [r.origin for r in index.records],
+            ["Packages", "Installed", "Installed", "Default", "Default"]
+        )
+        self.assertEqual(
+            sorted((r.origin, r.name) for r in index.records),
+            [("Default", "Default"), ("Default", "Other"), ("Installed", "Other"), ("Installed", "Pkg"),
+             ("Packages", "Pkg")]
+        )
+        self.assertEqual(sorted(index.get_package("Pkg")[0].resources), ["plugin.py", "sub/util.py"])
+
+        generation = index.generation
+        records = list(index.records)
+        index.refresh()
+        self.assertEqual(index.generation, generation)
+        self.assertEqual([id(r) for r in index.records], [id(r) for r in records])
+
+    def test_stale(self):
+        """Test that only the packages whose signature changed are read again."""
+
+        index = self.get_index()
+        records = list(index.records)
+        self.write("Packages/Pkg/sub/new.py", "")
+        touch_later(self.path("Packages/Pkg/sub"))
+        self.zip("App/Packages/Default.sublime-package", ["Default.sublime-keymap", "Main.sublime-menu"])
+        touch_later(self.path("App/Packages/Default.sublime-package"))
+
+        changed = [("Packages", "Pkg"), ("Default", "Default")]
+        for record in records:
+            self.assertEqual(index.is_stale(record), (record.origin, record.name) in changed)
+        generation = index.generation
+        index.refresh()
+        self.assertEqual(index.generation, generation + 1)
+        for old, new in zip(records, index.records):
+            self.assertEqual(old is new, (old.origin, old.name) not in changed)
+        self.assertIn("sub/new.py", index.get_records("Packages")[0].resources)
+        self.assertIn("Main.sublime-menu", index.get_package("Default")[0].resources)
+
+        shutil.rmtree(self.path("Packages/Pkg"))
+        index.refresh()
+        self.assertEqual(index.get_records("Packages"), [])
+
+    def test_snapshot(self):
+        """Test that a loaded snapshot is used as is until packages or exclusions change."""
+
+        index = self.get_index()
+        loaded = ps.ResourceIndex(self.cache_file)
+        loaded.load()
+        self.assertEqual(loaded.exclude_patterns, index.exclude_patterns)
+        self.assertEqual(
+            [(r.name, r.origin, r.path, r.signature, r.resources) for r in loaded.records],
+            [(r.name, r.origin, r.path, r.signature, r.resources) for r in index.records]
+        )
+        records = list(loaded.records)
+        loaded.refresh()
+        self.assertEqual([id(r) for r in loaded.records], [id(r) for r in records])
+
+        sublime_stub.load_settings("package_file_search.sublime-settings").set(
+            "exclude_patterns", list(ps.DEFAULT_EXCLUDE_PATTERNS) + ["*.tmTheme"]
+        )
+        excluded = ps.ResourceIndex(self.cache_file)
+        excluded.load()
+        records = list(excluded.records)
+        excluded.refresh()
+        self.assertFalse(any(old is new for old, new in zip(records, excluded.records)))
+        self.assertEqual(excluded.get_package("Pkg")[1].resources, ["plugin.py"])
+
+    def test_snapshot_version(self):
+        """Test that a snapshot from another version is ignored."""
+
+        self.get_index()
+        ps.INDEX_CACHE_VERSION += 1
+        try:
+            loaded = ps.ResourceIndex(self.cache_file)
+            loaded.load()
+        finally:
+            ps.INDEX_CACHE_VERSION -= 1
+        self.assertEqual(loaded.records, [])
+
+    def test_effective(self):
+        """Test that overrides are resolved and ignored packages are left out."""
+
+        index = self.get_index()
+        self.assertEqual(
+            sorted(index.get_effective_resources()),
+            [
+                "Packages/Default/Default.sublime-keymap",
+                "Packages/Other/other.py",
+                "Packages/Pkg/plugin.py",
+                "Packages/Pkg/sub/util.py",
+                "Packages/Pkg/theme.tmTheme"
+            ]
+        )
+        overrides = {res: record.origin for name, record, res in index.iter_effective() if name == "Pkg"}
+        self.assertEqual(overrides["plugin.py"], "Packages")
+        self.assertEqual(overrides["theme.tmTheme"], "Installed")
+
+        generation = index.generation
+        sublime_stub.load_settings("Preferences.sublime-settings").set("ignored_packages", ["Other"])
+        index.refresh()
+        self.assertEqual(index.generation, generation + 1)
+        self.assertNotIn("Packages/Other/other.py", index.get_effective_resources())
+
+    def test_benchmark(self):
+        """Test that the serial and parallel reads are compared."""
+
+        count, _, _, workers, rounds, matched = ps.benchmark_index(2, 2)
+        self.assertEqual((count, workers, rounds, matched), (5, 2, 2, True))
+
+    def test_count_setting(self):
+        """Test that counts that aren't positive whole numbers fall back to the default."""
+
+        settings = sublime_stub.load_settings("package_file_search.sublime-settings")
+        for value, expected in ((8, 8), ("8", 4), (0, 4), (-2, 4), (2.5, 4), (True, 4), (None, 4)):
+            settings.set("index_workers", value)
+            self.assertEqual(ps.get_index_workers(), expected, value)
+
+    def test_catalog(self):
+        """Test that the catalog lists every package without reading them."""
+
+        read_package = ps.ResourceIndex.read_package
+        ps.ResourceIndex.read_package = None
+        try:
+            catalog = ps.get_catalog()
+        finally:
+            ps.ResourceIndex.read_package = read_package
+        self.assertEqual(len(catalog), 5)
+        default, installed, unpacked = ps.get_packages_location()
+        self.assertEqual(
+            sorted(os.path.basename(p) for p in default), ["Default.sublime-package", "Other.sublime-package"]
+        )
+        self.assertEqual(unpacked, [self.path("Packages/Pkg")])
+
+    def test_package_tree(self):
+        """Test that the package tree and names come from the given index without refreshing it again."""
+
+        index = self.get_index()
+        get_index = ps.get_index
+        ps.get_index = None
+        try:
+            self.assertEqual(ps.get_packages(index), ["Default", "Other", "Pkg"])
+            tree = ps.get_package_tree("Packages/Pkg/", index)
+            self.assertIs(ps.get_package_tree("Packages/Pkg/", index), tree)
+        finally:
+            ps.get_index = get_index
+        self.assertEqual(tree.items(), ["sub/", "plugin.py", "theme.tmTheme"])
+        self.assertEqual(tree.get("sub/").items(), ["util.py"])
+
+
+class TestQueryCache(unittest.TestCase):
+    """Test the search result cache."""
+
+    def test_key(self):
+        """Test that results are keyed by pattern, mode, generation, and limit."""
+
+        key = ps.QueryCache.make_key
+        self.assertEqual(key(" *.py ", False, True, 1), key("*.py", False, True, 1))
+        self.assertNotEqual(key(" *.py ", False, False, 1), key("*.py", False, False, 1))
+        self.assertNotEqual(key("*.py", False, True, 1), key("*.py", True, True, 1))
+        self.assertNotEqual(key("*.py", False, True, 1), key("*.py", False, True, 2))
+        self.assertNotEqual(key("*.py", False, True, 1), key("*.py", False, True, 1, 10))
+
+    def test_evict(self):
+        """Test that the least recently used results are dropped first."""
+
+        cache = ps.QueryCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats(), (1, 1, 2, 2))
+        cache.set_size(1)
+        self.assertEqual(list(cache.entries), ["c"])
+        cache.clear()
+        self.assertEqual(cache.stats(), (0, 0, 0, 1))
+
+
+class TestPackageSearch(PackageTestCase):
+    """Test searching the index."""
+
+    def setUp(self):
+        """Create the packages and a search."""
+
+        PackageTestCase.setUp(self)
+        self.search = ps.PackageSearch()
+        self.search.search_id = ps.PackageSearch.active_search
+        self.search.last_progress = 0
+        self.search.truncated = False
+        self.search.max_results = None
+        self.search.index = self.get_index()
+
+    def test_collect(self):
+        """Test that collecting stops at the limit and reports truncation."""
+
+        self.search.max_results = 2
+        self.assertEqual(self.search.collect(iter(range(5))), ([0, 1], True))
+        self.assertEqual(self.search.collect(iter(range(2))), ([0, 1], False))
+        self.search.max_results = None
+        self.assertEqual(self.search.collect(iter(range(5))), ([0, 1, 2, 3, 4], False))
+        ps.PackageSearch.active_search += 1
+        self.assertIsNone(self.search.collect(iter(range(5))))
+
+    def test_find(self):
+        """Test searching the active files."""
+
+        items, truncated = self.search.find("*.py", False)
+        self.assertEqual(items, ["Packages/Other/other.py", "Packages/Pkg/plugin.py", "Packages/Pkg/sub/util.py"])
+        self.assertFalse(truncated)
+        self.assertEqual(self.search.find(r"Packages/Pkg/.*\.tmTheme", True), (["Packages/Pkg/theme.tmTheme"], False))
+
+        self.search.max_results = 1
+        self.assertEqual(self.search.find("*.py", False), (["Packages/Other/other.py"], True))
+
+    def test_find_refined(self):
+        """Test that a regex is only refined from the last results when it can't match more."""
+
+        self.assertEqual(len(self.search.find("Packages/Pkg", True)[0]), 3)
+        self.assertEqual(
+            self.search.find(r"Packages/Pkg/.*\.py", True)[0], ["Packages/Pkg/plugin.py", "Packages/Pkg/sub/util.py"]
+        )
+        self.search.find("Packages/Pkg", True)
+        self.assertIn("Packages/Other/other.py", self.search.find(r"Packages/Pkg|.*other\.py", True)[0])
+
+        # An escaped brace can't be counted as closing a repeat.
+        self.write("Packages/}aa/x.py", "")
+        self.search.index = self.get_index()
+        self.assertEqual(self.search.find(r".*\}a{2", True)[0], [])
+        self.assertEqual(self.search.find(r".*\}a{2}", True)[0], ["Packages/}aa/x.py"])
+
+    def test_find_raw(self):
+        """Test searching every copy of every file."""
+
+        items, truncated = self.search.find_raw("*.py")
+        self.assertEqual(
+            sorted(tuple(r.row()) for r in items),
+            [
+                (os.path.join("Other.sublime-package", "default_only.py"), "Default"),
+                (os.path.join("Other.sublime-package", "other.py"), "Default"),
+                (os.path.join("Other.sublime-package", "other.py"), "Installed"),
+                (os.path.join("Pkg.sublime-package", "plugin.py"), "Installed"),
+                (os.path.join("Pkg", "plugin.py"), "Packages"),
+                (os.path.join("Pkg", "sub", "util.py"), "Packages")
+            ]
+        )
+        self.assertFalse(truncated)
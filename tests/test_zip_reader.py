@@ -0,0 +1,141 @@
+"""Test zip reader."""
+import unittest
+import codecs
+import os
+import shutil
+import tempfile
+import zipfile
+from lib import zip_reader
+
+
+class TestZipReader(unittest.TestCase):
+    """Test reading the central directory and members of archives."""
+
+    def setUp(self):
+        """Create a test archive."""
+
+        self.tempdir = tempfile.mkdtemp(prefix="pkgfs_test")
+        self.archive = os.path.join(self.tempdir, "Test.sublime-package")
+        with zipfile.ZipFile(self.archive, 'w') as z:
+            z.writestr("Default.sublime-keymap", '[\n    {"keys": ["ctrl+a"], "command": "noop"}\n]\n')
+            z.writestr(zipfile.ZipInfo("folder/"), "")
+            z.writestr("folder/stored.txt", "stored content\n", compress_type=zipfile.ZIP_STORED)
+            z.writestr("folder/deflated.py", "print('hello')\n" * 100, compress_type=zipfile.ZIP_DEFLATED)
+            z.writestr("folder/ünicode.txt", "unicode\n")
+
+    def tearDown(self):
+        """Remove the test archive."""
+
+        shutil.rmtree(self.tempdir)
+
+    def test_entries_match_zipfile(self):
+        """Test that entries match what zipfile reports."""
+
+        with zipfile.ZipFile(self.archive) as z:
+            expected = [(i.filename, i.file_size, i.compress_size, i.CRC) for i in z.infolist()]
+        with zip_reader.ZipReader(self.archive) as z:
+            entries = [(e.name, e.size, e.compressed_size, e.crc) for e in z.entries]
+        self.assertEqual(entries, expected)
+
+    def test_read_members(self):
+        """Test reading stored and deflated members."""
+
+        with zipfile.ZipFile(self.archive) as z:
+            expected = {name: z.read(name) for name in z.namelist()}
+        with zip_reader.ZipReader(self.archive) as z:
+            for name in z.names():
+                self.assertEqual(z.read(name), expected[name])
+            self.assertTrue(z.get("folder/").is_dir())
+            self.assertIsNone(z.get("missing.txt"))
+            self.assertRaises(KeyError, z.read, "missing.txt")
+
+    def test_prepended_data(self):
+        """Test archives with data prepended to them."""
+
+        prefixed = os.path.join(self.tempdir, "Prefixed.sublime-package")
+        with open(prefixed, 'wb') as f:
+            f.write(b"#!prefix\n" * 10)
+            with open(self.archive, 'rb') as a:
+                f.write(a.read())
+        with zip_reader.ZipReader(prefixed) as z:
+            self.assertEqual(z.read("folder/stored.txt"), b"stored content\n")
+
+    def test_bad_archive(self):
+        """Test that files that are not archives raise `BadZipfile`."""
+
+        bad = os.path.join(self.tempdir, "Bad.sublime-package")
+        with open(bad, 'wb') as f:
+            f.write(b"not an archive")
+        self.assertRaises(zipfile.BadZipfile, zip_reader.ZipReader, bad)
+
+        empty = os.path.join(self.tempdir, "Empty.sublime-package")
+        open(empty, 'wb').close()
+        self.assertRaises(zipfile.BadZipfile, zip_reader.ZipReader, empty)
+
+    def test_member_cache(self):
+        """Test that members are served from the cache and evicted by size."""
+
+        cache = zip_reader.MemberCache(budget=1024)
+        self.assertEqual(zip_reader.read_member(self.archive, "folder/stored.txt", cache), b"stored content\n")
+        self.assertEqual(zip_reader.read_member(self.archive, "folder/stored.txt", cache), b"stored content\n")
+        hits, misses, count, size, budget = cache.stats()
+        self.assertEqual((hits, misses, count, size), (1, 1, 1, 15))
+
+        # Too large for the budget, so it is never cached
+        zip_reader.read_member(self.archive, "folder/deflated.py", cache)
+        self.assertEqual(cache.stats()[2], 1)
+
+        cache.put(("a",), b"x" * 600)
+        cache.put(("b",), b"x" * 600)
+        self.assertIsNone(cache.get(("a",)))
+        self.assertIsNotNone(cache.get(("b",)))
+        self.assertRaises(KeyError, zip_reader.read_member, self.archive, "missing.txt", cache)
+
+    def test_read_member_head(self):
+        """Test reading only the start of large members."""
+
+        cache = zip_reader.MemberCache()
+        data, size = zip_reader.read_member_head(self.archive, "folder/deflated.py", 100, cache)
+        self.assertEqual((data, size), (("print('hello')\n" * 100).encode('utf-8')[:100], 1500))
+        self.assertEqual(cache.stats()[2], 0)
+
+        data, size = zip_reader.read_member_head(self.archive, "folder/stored.txt", 100, cache)
+        self.assertEqual((data, size), (b"stored content\n", 15))
+        self.assertEqual(cache.stats()[2], 1)
+        self.assertRaises(KeyError, zip_reader.read_member_head, self.archive, "missing.txt", 100, cache)
+
+
+class TestDecodeContent(unittest.TestCase):
+    """Test decoding archived content and cutting previews."""
+
+    def test_utf16_le_preview(self):
+        """Test that a UTF-16 LE preview cut mid code unit ends on a whole line."""
+
+        data = codecs.BOM_UTF16_LE + "line one\nline two\nline three".encode("utf_16_le")
+        for size in range(2, len(data)):
+            text, encoding = zip_reader.decode_content(zip_reader.end_on_line(data[:size]))
+            self.assertEqual(encoding, "UTF-16 LE with BOM", size)
+        self.assertEqual(zip_reader.decode_content(zip_reader.end_on_line(data[:31]))[0], "line one\n")
+
+    def test_utf16_be_preview(self):
+        """Test that a UTF-16 BE preview ends on a whole line, even past code units holding a newline byte."""
+
+        data = codecs.BOM_UTF16_BE + "a\n\u0a0a\nc".encode("utf_16_be")
+        for size in range(2, len(data)):
+            text, encoding = zip_reader.decode_content(zip_reader.end_on_line(data[:size]))
+            self.assertEqual(encoding, "UTF-16 BE with BOM", size)
+        self.assertEqual(zip_reader.decode_content(zip_reader.end_on_line(data[:9]))[0], "a\n")
+        self.assertEqual(zip_reader.decode_content(zip_reader.end_on_line(data[:10]))[0], "a\n\u0a0a\n")
+
+    def test_utf8_preview(self):
+        """Test that other content is cut after its last newline."""
+
+        self.assertEqual(zip_reader.end_on_line(b"ab\ncd"), b"ab\n")
+        self.assertEqual(zip_reader.end_on_line(b"abcd"), b"abcd")
+
+    def test_bom_fallback(self):
+        """Test that content with a BOM that doesn't decode falls back to the other encodings."""
+
+        self.assertEqual(zip_reader.decode_content(codecs.BOM_UTF16_LE + b"abc")[1], "Western (Windows 1252)")
+        self.assertEqual(zip_reader.decode_content(codecs.BOM_UTF8 + b"ok"), ("ok", "UTF-8 with BOM"))
+        self.assertEqual(zip_reader.decode_content(b"caf\xe9"), ("caf\xe9", "Western (Windows 1252)"))
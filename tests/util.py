@@ -0,0 +1,15 @@
+"""Shared test helpers."""
+
+
+class Record(object):
+    """Package record stand in."""
+
+    def __init__(self, name, origin, path, resources, signature=None):
+        """Initialize."""
+
+        self.name = name
+        self.origin = origin
+        self.path = path
+        self.resources = resources
+        self.signature = signature
+        self.archived = origin != "Packages"